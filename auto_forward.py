@@ -14,7 +14,11 @@ from telegram.ext import (
     MessageHandler
 )
 
-from utils import Config, user_format, get_filter
+from utils import Config, user_format, get_filter, event_loop
+from utils.bot import get_bot, update_workers
+from utils.webhook import start_updates
+from utils.recorder import recorder
+from utils.outbound import scheduled
 from utils.push import Message as Msg
 from markup import main_buttons, parse_url
 
@@ -23,12 +27,13 @@ logger = logging.getLogger('push_helper')
 
 
 def auto_forward(update: Update, context: CallbackContext):
-    bot = Bot(token=Config.token)
+    bot = scheduled(get_bot())
 
     if update.message == None:
         message = update.channel_post
     else:
         message = update.message
+    source = message
     from_chat = update.effective_chat
 
     use_push_all = False
@@ -45,19 +50,19 @@ def auto_forward(update: Update, context: CallbackContext):
                 to_chat_ids = Config.forward[str(
                     user_format(from_chat.id)) + ":push"]
             use_push_all = True
+    # Pushed once to all of its targets, so the url is resolved and its media downloaded only once
+    push_targets = list()
     for to_chat_id in to_chat_ids:
         if isinstance(to_chat_id, str):
             split_result = to_chat_id.split(":")
             if len(split_result) == 2 or use_push_all:
                 try:
-                    to_chat = [int(split_result[0])]
+                    push_targets.append(int(split_result[0]))
                 except ValueError:
-                    to_chat = [user_format(split_result[0])]
-                Msg(parse_url(message)).push(targets_additional=to_chat)
+                    push_targets.append(user_format(split_result[0]))
                 continue
         if use_push_all:
-            Msg(parse_url(message)).push(
-                targets_additional=[user_format(to_chat_id)])
+            push_targets.append(user_format(to_chat_id))
         else:
             message: Message = bot.send_message(
                 user_format(to_chat_id),
@@ -66,7 +71,11 @@ def auto_forward(update: Update, context: CallbackContext):
                 disable_notification=True,
                 # reply_markup=main_buttons(message.message_id)
             )
-    message.edit_reply_markup(
+    if push_targets:
+        Msg(parse_url(source)).push(targets_additional=push_targets)
+    bot.edit_message_reply_markup(
+        chat_id=message.chat_id,
+        message_id=message.message_id,
         reply_markup=main_buttons(message.message_id)
     )
 
@@ -84,8 +93,10 @@ def register(updater: Updater):
 
 
 if __name__ == "__main__":
-    updater = Updater(token=Config.token, use_context=True)
+    updater = Updater(bot=get_bot(), use_context=True, workers=update_workers())
     register(updater)
-    updater.start_polling()
+    recorder.register(updater.dispatcher)
+    event_loop.bind_updater(updater)
+    start_updates(updater)
     logger.info(f"Bot @{updater.bot.get_me().username} 已启动: 仅自动转发")
     updater.idle()
@@ -0,0 +1 @@
+'''Offline benchmarks of the bot against local stand-ins for Telegram, Bilibili and Pixiv.'''
@@ -0,0 +1,8 @@
+import sys
+
+from .push import main
+
+
+if __name__ == '__main__':
+    # Non-zero when any delivery did not succeed
+    sys.exit(1 if main()['failed'] else 0)
@@ -0,0 +1,376 @@
+'''Local stand-ins for the Bot API and the upstream sites, so that pushes can be measured offline.
+
+`FakeBotAPI` answers Bot API methods after a configurable latency and rejects a share of them with 429.
+`FakeUpstream` serves the responses of a recording made with `utils.recorder`, falling back to the samples in `fixtures/` for Bilibili and Pixiv. It tells the sites apart by the `X-Forwarded-Host` header that `utils.sessions` adds for overridden hosts.
+Both count what they receive; `GET /_bench/stats` returns the counters as JSON.
+'''
+
+import gzip
+import json
+import random
+import threading
+import time
+
+from io import BytesIO
+from os import path
+from collections import Counter, deque
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Tuple
+from urllib.parse import parse_qs, parse_qsl, urlsplit
+
+
+__all__ = (
+    'FakeBotAPI',
+    'FakeUpstream',
+    'UPSTREAM_HOSTS',
+    'parse_body',
+    'read_records',
+    'serve',
+)
+
+
+FIXTURES = path.join(path.dirname(path.abspath(__file__)), 'fixtures')
+
+UPSTREAM_HOSTS = (
+    'api.bilibili.com',
+    'api.vc.bilibili.com',
+    'api.live.bilibili.com',
+    'i0.hdslb.com',
+    'b23.tv',
+    'app-api.pixiv.net',
+    'oauth.secure.pixiv.net',
+    'i.pximg.net',
+)
+
+
+def read_records(record_path: str) -> Iterator[Dict[str, Any]]:
+    '''The records of a recording made with `utils.recorder`, in order.'''
+    with gzip.open(record_path, 'rt', encoding='utf8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_body(content_type: str, body: bytes) -> Dict[str, Any]:
+    '''The fields of a JSON, urlencoded or multipart request body. Uploaded files are replaced by their size.'''
+    if not body:
+        return dict()
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+        fields = dict()
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True) or b''
+            fields[name] = len(payload) if part.get_filename() else payload.decode('utf8', 'replace')
+        return fields
+    return {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self, code: int, body: bytes, content_type: str = 'application/json'):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _respond_json(self, obj: Any, code: int = 200):
+        self._respond(code, json.dumps(obj, ensure_ascii=False).encode())
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _bench(self) -> bool:
+        '''Serve the bench endpoints, which skip latency and counting.'''
+        if not self.path.startswith('/_bench/'):
+            return False
+        if self.path == '/_bench/stats':
+            self._respond_json(self.server.stats())
+        elif self.path == '/_bench/reset':
+            self.server.reset()
+            self._respond_json(True)
+        else:
+            self._respond_json(False, 404)
+        return True
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+
+class _BotAPIHandler(_Handler):
+    server: 'FakeBotAPI'
+
+    def do_GET(self):
+        if not self._bench():
+            self.do_POST()
+
+    def do_POST(self):
+        if self._bench():
+            return
+        method = self.path.rsplit('/', 1)[-1]
+        body = self._read_body()
+        fields = parse_body(self.headers.get('Content-Type', ''), body)
+        code, response = self.server.answer(method, fields, len(body))
+        self._respond_json(response, code)
+
+
+class FakeBotAPI(ThreadingHTTPServer):
+    '''Answers Bot API calls like Telegram would, `latency` seconds later.
+
+    A `fail_rate` share of the calls that write to a chat is rejected with 429 and `retry_after`, drawn from a generator seeded with `seed` so runs are repeatable.
+    '''
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0, fail_rate: float = 0.0, retry_after: int = 1, seed: int = 0, admins: Iterable[int] = ()):
+        super().__init__(address, _BotAPIHandler)
+        self.admins = list(admins)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__message_id = 0
+            self.__files = 0
+            self.__calls: Counter = Counter()
+            self.__rate_limited = 0
+            self.__bytes = 0
+            self.__edits: Dict[int, float] = dict()
+            self.__chats: Dict[str, int] = dict()
+            self.__webhook: Dict[str, Any] = dict()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.__lock:
+            return {
+                'calls': dict(self.__calls),
+                'total_calls': sum(self.__calls.values()),
+                'rate_limited': self.__rate_limited,
+                'bytes_received': self.__bytes,
+                'edits': self.__edits,
+                'webhook': self.__webhook,
+            }
+
+    def __chat(self, chat_id: Any) -> Dict[str, Any]:
+        try:
+            return {'id': int(chat_id), 'type': 'private' if int(chat_id) > 0 else 'supergroup', 'first_name': 'bench'}
+        except (TypeError, ValueError):
+            username = str(chat_id).lstrip('@')
+            chat_id = self.__chats.setdefault(username, -1001000000000 - len(self.__chats))
+            return {'id': chat_id, 'type': 'channel', 'title': username, 'username': username}
+
+    def __message(self, fields: Dict[str, Any], **content: Any) -> Dict[str, Any]:
+        self.__message_id += 1
+        message = {
+            'message_id': self.__message_id,
+            'date': int(time.time()),
+            'chat': self.__chat(fields.get('chat_id', 1)),
+        }
+        message.update(content)
+        return message
+
+    def __file_id(self, kind: str) -> str:
+        self.__files += 1
+        return f'bench-{kind}-{self.__files}'
+
+    def __photo(self) -> List[Dict[str, Any]]:
+        file_id = self.__file_id('photo')
+        return [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1280, 'height': 960}]
+
+    def answer(self, method: str, fields: Dict[str, Any], size: int) -> Tuple[int, Dict[str, Any]]:
+        if self.latency:
+            time.sleep(self.latency)
+        with self.__lock:
+            self.__calls[method] += 1
+            self.__bytes += size
+            if method not in ('getMe', 'getUpdates', 'getChat', 'getChatAdministrators') and self.__random.random() < self.fail_rate:
+                self.__rate_limited += 1
+                return 429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after},
+                }
+            return 200, {'ok': True, 'result': self.__result(method, fields)}
+
+    def __result(self, method: str, fields: Dict[str, Any]) -> Any:
+        if method == 'getMe':
+            return {'id': 123456, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        if method == 'getChat':
+            return self.__chat(fields.get('chat_id'))
+        if method == 'getChatAdministrators':
+            return [
+                {'user': {'id': user_id, 'is_bot': False, 'first_name': 'admin'}, 'status': 'administrator', 'can_be_edited': False}
+                for user_id in self.admins
+            ]
+        if method == 'getUpdates':
+            return []
+        if method == 'setWebhook':
+            self.__webhook = {name: fields.get(name) for name in ('url', 'secret_token', 'allowed_updates')}
+            return True
+        if method == 'sendMediaGroup':
+            media = fields.get('media', [])
+            if isinstance(media, str):
+                media = json.loads(media)
+            return [self.__message(fields, photo=self.__photo()) for _ in media]
+        if method in ('sendPhoto', 'sendAnimation'):
+            return self.__message(fields, photo=self.__photo(), caption=fields.get('caption', ''))
+        if method in ('sendVideo', 'sendAudio', 'sendDocument'):
+            kind = method[4:].lower()
+            file_id = self.__file_id(kind)
+            return self.__message(fields, **{kind: {'file_id': file_id, 'file_unique_id': file_id, 'duration': 1}})
+        if method == 'editMessageReplyMarkup':
+            message_id = int(fields.get('message_id', 0))
+            self.__edits[message_id] = time.time()
+            return True if 'inline_message_id' in fields else self.__message(fields, text='')
+        if method.startswith(('send', 'forward', 'copy', 'edit')):
+            return self.__message(fields, text=fields.get('text', ''))
+        return True
+
+
+def _image(size: Tuple[int, int]) -> bytes:
+    # Imported here so that only the process serving images pays for it
+    from PIL import Image
+
+    image = Image.merge('RGB', [Image.effect_noise(size, sigma) for sigma in (32, 48, 64)])
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=85)
+    return output.getvalue()
+
+
+def _fixture(name: str) -> str:
+    with open(path.join(FIXTURES, name), encoding='utf8') as file:
+        return file.read()
+
+
+class _UpstreamHandler(_Handler):
+    server: 'FakeUpstream'
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        if self._bench():
+            return
+        url = urlsplit(self.path)
+        code, body, content_type = self.server.answer(self.headers.get('X-Forwarded-Host', ''), url.path, url.query)
+        self._respond(code, body, content_type)
+
+    def do_POST(self):
+        if self._bench():
+            return
+        self._read_body()
+        self.do_GET()
+
+
+Exchange = Tuple[str, str, Tuple[Tuple[str, str], ...]]
+
+
+def _exchange(host: str, url_path: str, query: str) -> Exchange:
+    return host, url_path, tuple(sorted(parse_qsl(query, keep_blank_values=True)))
+
+
+class FakeUpstream(ThreadingHTTPServer):
+    '''Serves upstream responses `latency` seconds later.
+
+    Requests that were recorded in `record_path` get the recorded responses, in recorded order and repeating the last one.
+    Other Bilibili and Pixiv requests get the samples in `fixtures/` for any id; everything else is counted as unmatched and gets a 404.
+    Media are recorded by size only, so a generated image stands in for them.
+    '''
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0, record_path: str = ''):
+        super().__init__(address, _UpstreamHandler)
+        self.latency = latency
+        self.__recorded: Dict[Exchange, Deque[Dict[str, Any]]] = dict()
+        for record in (read_records(record_path) if record_path else ()):
+            if record['kind'] == 'http':
+                url = urlsplit(record['url'])
+                self.__recorded.setdefault(_exchange(record['host'], url.path, url.query), deque()).append(record)
+        self.__fixtures = {
+            name: _fixture(f'{name}.json')
+            for name in ('bili_dynamic_detail', 'bili_reply', 'pixiv_auth', 'pixiv_illust_detail')
+        }
+        self.__images = {'large': _image((1200, 900)), 'original': _image((1600, 1200))}
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__calls: Counter = Counter()
+            self.__replayed = 0
+            self.__unmatched = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.__lock:
+            return {
+                'calls': dict(self.__calls),
+                'total_calls': sum(self.__calls.values()),
+                'replayed': self.__replayed,
+                'unmatched': self.__unmatched,
+            }
+
+    def __json(self, name: str, **values: str) -> Tuple[int, bytes, str]:
+        text = self.__fixtures[name]
+        for key, value in values.items():
+            text = text.replace(f'{{{key}}}', value)
+        return 200, text.encode(), 'application/json'
+
+    def __replay(self, record: Dict[str, Any]) -> Tuple[int, bytes, str]:
+        content_type = record['content_type']
+        if record['body'] is not None:
+            body = record['body'].encode()
+        elif content_type.startswith('image/'):
+            body = self.__images['original']
+        else:
+            body = bytes(record['size'] or 0)
+        return record['status'], body, content_type
+
+    def answer(self, host: str, url_path: str, query_string: str) -> Tuple[int, bytes, str]:
+        if self.latency:
+            time.sleep(self.latency)
+        with self.__lock:
+            self.__calls[f'{host}{url_path}'] += 1
+            if (records := self.__recorded.get(_exchange(host, url_path, query_string))) is not None:
+                self.__replayed += 1
+                record = records.popleft() if len(records) > 1 else records[0]
+                return self.__replay(record)
+
+        query = parse_qs(query_string)
+
+        def param(name: str, default: str = '0') -> str:
+            return query.get(name, [default])[-1]
+
+        if url_path.endswith('/get_dynamic_detail'):
+            return self.__json('bili_dynamic_detail', dynamic_id=param('dynamic_id', param('rid')))
+        if url_path == '/x/v2/reply':
+            return self.__json('bili_reply')
+        if url_path == '/auth/token':
+            return self.__json('pixiv_auth')
+        if url_path == '/v1/illust/detail':
+            return self.__json('pixiv_illust_detail', illust_id=param('illust_id'))
+        if url_path.endswith(('.jpg', '.png')):
+            image = self.__images['large' if 'master' in url_path else 'original']
+            return 200, image, 'image/jpeg'
+        with self.__lock:
+            self.__unmatched += 1
+        return 404, b'{"code": -404, "message": "not recorded"}', 'application/json'
+
+
+def serve(conn, latency: float, fail_rate: float, retry_after: int, seed: int, upstream_latency: float, record_path: str = '', admins: Iterable[int] = ()) -> None:
+    '''Run both servers on free local ports until the process is terminated, sending `(bot_api_port, upstream_port)` through `conn` once they listen.'''
+    bot_api = FakeBotAPI(('127.0.0.1', 0), latency, fail_rate, retry_after, seed, admins)
+    upstream = FakeUpstream(('127.0.0.1', 0), upstream_latency, record_path)
+    threading.Thread(target=upstream.serve_forever, name='upstream', daemon=True).start()
+    conn.send((bot_api.server_address[1], upstream.server_address[1]))
+    bot_api.serve_forever()
@@ -0,0 +1,133 @@
+'''Shared setup of the benchmarks: the fake servers in a child process and a throwaway working directory configured to use them.
+
+The bot modules read `push_config.json` from the working directory when they are imported, so `Workspace` must be entered before importing anything from `utils`, `commands`, `markup` or `auto_forward`.
+'''
+
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import urllib.request
+
+from typing import Any, Dict, List, Optional, Sequence
+
+from .fake_servers import UPSTREAM_HOSTS, serve
+
+
+__all__ = (
+    'Servers',
+    'Workspace',
+    'percentile',
+    'peak_rss_mb',
+)
+
+
+class Servers:
+    '''The fake Bot API and upstream servers, running in a child process so that they do not count towards the measured memory and CPU.'''
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            fail_rate: float = 0.0,
+            retry_after: int = 1,
+            seed: int = 0,
+            upstream_latency: float = 0.0,
+            record_path: str = '',
+            admins: Sequence[int] = ()):
+        self.__args = (latency, fail_rate, retry_after, seed, upstream_latency, record_path, list(admins))
+        self.__process: Optional[multiprocessing.Process] = None
+        self.bot_api_port = 0
+        self.upstream_port = 0
+
+    def __enter__(self) -> 'Servers':
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        self.__process = multiprocessing.Process(target=serve, args=(sender, *self.__args), name='bench_servers', daemon=True)
+        self.__process.start()
+        self.bot_api_port, self.upstream_port = receiver.recv()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.__process.terminate()
+        self.__process.join()
+
+    @ property
+    def bot_api_url(self) -> str:
+        return f'http://127.0.0.1:{self.bot_api_port}/bot'
+
+    @ property
+    def upstream_url(self) -> str:
+        return f'http://127.0.0.1:{self.upstream_port}'
+
+    @ staticmethod
+    def __get(port: int, name: str) -> Any:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/_bench/{name}') as resp:
+            return json.load(resp)
+
+    def bot_api_stats(self) -> Dict[str, Any]:
+        return self.__get(self.bot_api_port, 'stats')
+
+    def upstream_stats(self) -> Dict[str, Any]:
+        return self.__get(self.upstream_port, 'stats')
+
+    def reset(self) -> None:
+        self.__get(self.bot_api_port, 'reset')
+        self.__get(self.upstream_port, 'reset')
+
+
+class Workspace:
+    '''A temporary working directory whose `push_config.json` points the bot at `servers`, or at nothing when `servers` is None.
+
+    Outbound rate limits are lifted unless `telegram_rates` is set, so that the numbers show the cost of the code rather than the pacing.
+    '''
+
+    def __init__(self, servers: Optional[Servers], targets: Sequence[str], config: Optional[Dict[str, Any]] = None, telegram_rates: bool = False, keep: bool = False):
+        self.__config = {
+            'token': '123456:bench',
+            'tags': ['bench'],
+            'targets': list(targets),
+            'watchers': ['@bench_watchers'],
+            'forward': {'@bench_source:push': list(targets)},
+            'pixiv_refresh_token': 'bench',
+            'admin_refresh_interval': 0,
+        }
+        if servers is not None:
+            self.__config.update(
+                bot_api_base_url=servers.bot_api_url,
+                http_host_overrides={host: servers.upstream_url for host in UPSTREAM_HOSTS},
+            )
+        if not telegram_rates:
+            self.__config.update(send_rate_global=1e6, send_rate_group=1e8, send_rate_private=1e8)
+        self.__config.update(config or {})
+        self.__keep = keep
+        self.__previous = os.getcwd()
+        self.path = ''
+
+    def __enter__(self) -> 'Workspace':
+        self.path = tempfile.mkdtemp(prefix='push_helper_bench_')
+        with open(os.path.join(self.path, 'push_config.json'), 'w', encoding='utf8') as file:
+            json.dump(self.__config, file, ensure_ascii=False, indent=4)
+        os.chdir(self.path)
+        return self
+
+    def __exit__(self, *exc_info):
+        os.chdir(self.__previous)
+        if not self.__keep:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+def percentile(values: List[float], q: float) -> float:
+    '''The `q`-th percentile of `values` by linear interpolation, 0 for no values.'''
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def peak_rss_mb() -> float:
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
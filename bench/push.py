@@ -0,0 +1,227 @@
+'''Push throughput benchmark.
+
+    python -m bench --scenario command --items 500 --targets 5 --backend mixed
+
+Scenarios:
+    message     `Message.push` of every item from the dispatcher worker threads, like the single push button
+    command     one `/push` of a queue holding every item, through `commands.push.run`
+    forward     `auto_forward.auto_forward` of one channel post per item, each forwarded to every target
+
+Latency is measured per item: the duration of the call for `message` and `forward`, and the time from the command to the edit of the item's keyboard for `command`.
+'''
+
+import argparse
+import itertools
+import json
+import logging
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from .harness import Servers, Workspace, peak_rss_mb, percentile
+
+
+__all__ = (
+    'main',
+)
+
+
+BACKENDS = ('link', 'bili', 'pixiv')
+
+
+def item_url(backend: str, index: int) -> str:
+    if backend == 'mixed':
+        backend = BACKENDS[index % len(BACKENDS)]
+    return {
+        'link': f'https://example.com/bench/{index}',
+        'bili': f'https://t.bilibili.com/{700000000000000000 + index}',
+        'pixiv': f'https://www.pixiv.net/artworks/{90000000 + index}',
+    }[backend]
+
+
+def _timed(func: Callable[..., Any]) -> Callable[..., float]:
+    def wrapped(*args) -> float:
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+    return wrapped
+
+
+def run_message(urls: List[str], targets: int, servers: Servers) -> List[float]:
+    import utils.push as push
+    from utils.bot import update_workers
+
+    messages = list()
+    for url in urls:
+        message = push.Message(url)
+        message.target_indices = set(range(targets))
+        messages.append(message)
+    with ThreadPoolExecutor(max_workers=update_workers(), thread_name_prefix='bench') as pool:
+        return list(pool.map(_timed(push.Message.push), messages))
+
+
+def run_command(urls: List[str], targets: int, servers: Servers) -> List[float]:
+    from telegram import Update
+    import utils.push as push
+    import commands.push as push_command
+    from utils.bot import get_bot
+
+    for message_id, url in enumerate(urls, 1):
+        message = push.Message(url)
+        message.target_indices = set(range(targets))
+        push.waiting_to_push[message_id] = message
+    update = Update.de_json({
+        'update_id': 1,
+        'message': {
+            'message_id': len(urls) + 1,
+            'date': int(time.time()),
+            'chat': {'id': -1001, 'type': 'supergroup', 'username': 'bench_watchers'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'bench'},
+            'text': '/push',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+        },
+    }, get_bot())
+
+    start = time.time()
+    push_command.run(update, SimpleNamespace(args=list()))
+    edits = servers.bot_api_stats()['edits']
+    return [edits[str(message_id)] - start for message_id in range(1, len(urls) + 1) if str(message_id) in edits]
+
+
+def run_forward(urls: List[str], targets: int, servers: Servers) -> List[float]:
+    from telegram import Update
+    from auto_forward import auto_forward
+    from utils.bot import get_bot, update_workers
+
+    bot = get_bot()
+    updates = [
+        Update.de_json({
+            'update_id': index,
+            'channel_post': {
+                'message_id': index,
+                'date': int(time.time()),
+                'chat': {'id': -1002, 'type': 'channel', 'username': 'bench_source'},
+                'text': url,
+                'entities': [{'type': 'url', 'offset': 0, 'length': len(url)}],
+            },
+        }, bot)
+        for index, url in enumerate(urls, 1)
+    ]
+    with ThreadPoolExecutor(max_workers=update_workers(), thread_name_prefix='bench') as pool:
+        return list(pool.map(_timed(auto_forward), updates, itertools.repeat(None)))
+
+
+SCENARIOS = {
+    'message': run_message,
+    'command': run_command,
+    'forward': run_forward,
+}
+
+
+DELIVERY_RESULTS = ('success', 'unresolved', 'failure', 'timeout')
+
+
+def delivery_results() -> Dict[str, int]:
+    '''Deliveries by result, summed over the targets, from the `push_deliveries` counter.'''
+    from utils import metrics
+
+    results = dict.fromkeys(DELIVERY_RESULTS, 0)
+    for _, labels, value in metrics.counter('push_deliveries', '').samples():
+        result = dict(labels)['result']
+        results[result] = results.get(result, 0) + int(value)
+    return results
+
+
+def report(options: argparse.Namespace, elapsed: float, latencies: List[float], servers: Servers) -> Dict[str, Any]:
+    from utils import metrics
+
+    bot_api = servers.bot_api_stats()
+    upstream = servers.upstream_stats()
+    deliveries = delivery_results()
+    # Only successful deliveries count towards the throughput
+    delivered = deliveries['success']
+    return {
+        'scenario': options.scenario,
+        'backend': options.backend,
+        'items': options.items,
+        'targets': options.targets,
+        'seconds': elapsed,
+        'items_per_second': delivered / options.targets / elapsed if elapsed and options.targets else 0.0,
+        'deliveries_per_second': delivered / elapsed if elapsed else 0.0,
+        'deliveries': deliveries,
+        'failed': sum(count for result, count in deliveries.items() if result != 'success'),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p99': percentile(latencies, 99),
+        'peak_rss_mb': peak_rss_mb(),
+        'bot_api_calls': bot_api['total_calls'],
+        'bot_api_calls_by_method': bot_api['calls'],
+        'bot_api_rate_limited': bot_api['rate_limited'],
+        'bot_api_bytes_received': bot_api['bytes_received'],
+        'upstream_calls': upstream['total_calls'],
+        'stages': metrics.summary().get('push_stage_seconds', {}),
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"{result['scenario']} ({result['backend']}): {result['items']} 条 × {result['targets']} 个目标, 用时 {result['seconds']:.2f} 秒")
+    print(f"    吞吐: {result['items_per_second']:.1f} 条/秒, {result['deliveries_per_second']:.1f} 次推送/秒 (仅计成功的推送)")
+    deliveries = result['deliveries']
+    print(f"    推送: 成功 {deliveries['success']} 次, 无法解析 {deliveries['unresolved']} 次, 失败 {deliveries['failure']} 次, 超时 {deliveries['timeout']} 次")
+    print(f"    延迟: p50 {result['latency_p50']:.3f} 秒, p99 {result['latency_p99']:.3f} 秒")
+    print(f"    内存峰值: {result['peak_rss_mb']:.1f} MiB")
+    print(f"    Bot API 调用: {result['bot_api_calls']} 次, 其中 429 {result['bot_api_rate_limited']} 次, 上传 {result['bot_api_bytes_received']} 字节")
+    for method, count in sorted(result['bot_api_calls_by_method'].items()):
+        print(f"        {method}: {count}")
+    print(f"    上游请求: {result['upstream_calls']} 次")
+    for labels, summary in result['stages'].items():
+        print(f"        {labels}: {summary}")
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Push throughput against local fake servers')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='command')
+    parser.add_argument('--backend', choices=BACKENDS + ('mixed',), default='mixed')
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--targets', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the Bot API takes per call')
+    parser.add_argument('--upstream-latency', type=float, default=0.05, help='seconds Bilibili and Pixiv take per request')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of Bot API calls answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--telegram-rates', action='store_true', help='keep the outbound rate limits of the config')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    parser.add_argument('--keep', action='store_true', help='keep the working directory')
+    parser.add_argument('--verbose', action='store_true', help='keep the logs of the bot')
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    targets = [f'@bench_target_{index}' for index in range(options.targets)]
+    urls = [item_url(options.backend, index) for index in range(options.items)]
+
+    with Servers(options.latency, options.fail_rate, options.retry_after, options.seed, options.upstream_latency) as servers, \
+            Workspace(servers, targets, telegram_rates=options.telegram_rates, keep=options.keep):
+        # The bot logs at INFO on import, set the level once its handlers are configured
+        import utils.push  # noqa: F401
+        if not options.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+            for name in ('push_helper', 'Bili_Feed_Parser'):
+                logging.getLogger(name).setLevel(logging.WARNING)
+
+        start = time.perf_counter()
+        latencies = SCENARIOS[options.scenario](urls, options.targets, servers)
+        elapsed = time.perf_counter() - start
+        result = report(options, elapsed, latencies, servers)
+
+        from utils import event_loop
+        event_loop.shutdown()
+
+    if options.json:
+        print(json.dumps(result, ensure_ascii=False, indent=4))
+    else:
+        print_report(result)
+    return result
@@ -0,0 +1,146 @@
+'''Replay a recording of real traffic against the fake servers.
+
+    python -m bench.replay traffic.jsonl.gz --speed 10
+
+Recordings are made by the bot itself with `record_path` set, see `utils.recorder`. The updates are fed to a dispatcher set up like `main.py`, with the configured chats and admins of the recording, at the original pacing divided by `--speed`, or back to back with `--speed 0`. Upstream requests are answered with the recorded responses.
+
+Replaying the same recording twice should give the same Bot API calls, which makes it usable as a regression test.
+'''
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from typing import Any, Dict, List
+from urllib.parse import urlsplit
+
+from .fake_servers import UPSTREAM_HOSTS, read_records
+from .harness import Servers, Workspace, peak_rss_mb
+
+
+__all__ = (
+    'main',
+)
+
+
+def load(record_path: str) -> Dict[str, Any]:
+    config: Dict[str, Any] = dict()
+    admins: List[int] = list()
+    updates: List[Dict[str, Any]] = list()
+    hosts = set(UPSTREAM_HOSTS)
+    for record in read_records(record_path):
+        kind = record['kind']
+        if kind == 'start':
+            config = record['config']
+        elif kind == 'admins':
+            admins = record['ids']
+        elif kind == 'update':
+            updates.append(record)
+        elif kind == 'http':
+            hosts.add(record['host'] or urlsplit(record['url']).hostname)
+    return {'config': config, 'admins': admins, 'updates': updates, 'hosts': sorted(hosts)}
+
+
+def replay(updates: List[Dict[str, Any]], speed: float) -> float:
+    '''Feed `updates` to a dispatcher set up like `main.py` and wait until all of them have been handled. Returns the seconds taken.'''
+    from telegram import Update
+    from telegram.ext import Updater
+    from utils.admins import admins
+    from utils.bot import get_bot, update_workers
+
+    import auto_forward
+    import commands
+    import markup
+
+    updater = Updater(bot=get_bot(), use_context=True, workers=update_workers())
+    for submodule in (commands, auto_forward, markup):
+        submodule.register(updater)
+    dispatcher = updater.dispatcher
+    admins.register(dispatcher)
+    admins.start(updater.bot)
+
+    ready = threading.Event()
+    thread = threading.Thread(target=dispatcher.start, kwargs={'ready': ready}, name='dispatcher', daemon=True)
+    thread.start()
+    ready.wait()
+
+    start = time.perf_counter()
+    first = updates[0]['t'] if updates else 0.0
+    for record in updates:
+        if speed > 0 and (delay := start + (record['t'] - first) / speed - time.perf_counter()) > 0:
+            time.sleep(delay)
+        dispatcher.update_queue.put(Update.de_json(record['update'], updater.bot))
+    while dispatcher.update_queue.qsize():
+        time.sleep(0.01)
+    # Stopping lets the workers finish every queued `run_async` handler first
+    dispatcher.stop()
+    return time.perf_counter() - start
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m bench.replay', description='Replay recorded updates and upstream responses')
+    parser.add_argument('record_path', help='a recording made with record_path set')
+    parser.add_argument('--speed', type=float, default=1.0, help='speed-up over the recorded pacing, 0 for no pauses')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the Bot API takes per call')
+    parser.add_argument('--upstream-latency', type=float, default=0.0, help='seconds added to every recorded response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of Bot API calls answered with 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--telegram-rates', action='store_true', help='keep the outbound rate limits of the config')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    parser.add_argument('--verbose', action='store_true', help='keep the logs of the bot')
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    record_path = os.path.abspath(options.record_path)
+    recording = load(record_path)
+    config = dict(recording['config'])
+    targets = config.pop('targets', None) or ['@bench_target_0']
+
+    with Servers(options.latency, options.fail_rate, 1, options.seed, options.upstream_latency, record_path, recording['admins']) as servers:
+        config['http_host_overrides'] = {host: servers.upstream_url for host in recording['hosts']}
+        with Workspace(servers, targets, config, telegram_rates=options.telegram_rates):
+            import utils.push  # noqa: F401
+            if not options.verbose:
+                logging.getLogger().setLevel(logging.WARNING)
+                for name in ('push_helper', 'Bili_Feed_Parser'):
+                    logging.getLogger(name).setLevel(logging.WARNING)
+
+            elapsed = replay(recording['updates'], options.speed)
+            bot_api = servers.bot_api_stats()
+            upstream = servers.upstream_stats()
+            result = {
+                'updates': len(recording['updates']),
+                'seconds': elapsed,
+                'updates_per_second': len(recording['updates']) / elapsed if elapsed else 0.0,
+                'peak_rss_mb': peak_rss_mb(),
+                'bot_api_calls': bot_api['total_calls'],
+                'bot_api_calls_by_method': bot_api['calls'],
+                'bot_api_rate_limited': bot_api['rate_limited'],
+                'upstream_calls': upstream['total_calls'],
+                'upstream_replayed': upstream['replayed'],
+                'upstream_unmatched': upstream['unmatched'],
+            }
+
+            from utils import event_loop
+            event_loop.shutdown()
+
+    if options.json:
+        print(json.dumps(result, ensure_ascii=False, indent=4))
+    else:
+        print(f"重放 {result['updates']} 条更新, 用时 {result['seconds']:.2f} 秒, {result['updates_per_second']:.1f} 条/秒")
+        print(f"    内存峰值: {result['peak_rss_mb']:.1f} MiB")
+        print(f"    Bot API 调用: {result['bot_api_calls']} 次, 其中 429 {result['bot_api_rate_limited']} 次")
+        for method, count in sorted(result['bot_api_calls_by_method'].items()):
+            print(f"        {method}: {count}")
+        print(f"    上游请求: {result['upstream_calls']} 次, 其中重放 {result['upstream_replayed']} 次, 未录制 {result['upstream_unmatched']} 次")
+    return result
+
+
+if __name__ == '__main__':
+    main()
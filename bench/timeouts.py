@@ -0,0 +1,118 @@
+'''Overhead of the `utils.timeout` wrappers.
+
+    python -m bench.timeouts --calls 200 --wait 0.2
+
+For every `WrapType`, a trivial function is called `--calls` times through the wrapper and the mean time over a direct call is reported. Then a call that never finishes is waited out for `--wait` seconds, and the CPU time the caller spent meanwhile is reported, which is close to 0 for wrappers that do not poll.
+
+`process (fork)` is `WrapType.PROCESS` with a closure, which cannot be sent to the pool and is run in a process forked for the call.
+'''
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+from functools import partial
+from typing import Any, Callable, Dict, List, Tuple
+
+from .harness import Workspace
+
+
+__all__ = (
+    'main',
+)
+
+
+def _noop(value: int = 0) -> int:
+    return value
+
+
+def _noop_timer(value: int = 0) -> Tuple[bool, int]:
+    return True, value
+
+
+def _never_timer() -> Tuple[bool, None]:
+    return False, None
+
+
+def _mean_seconds(func: Callable[[], Any], calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def _cpu_while_waiting(func: Callable[[], Any], exception_type: type) -> Tuple[float, float]:
+    '''Wall and CPU seconds of a call expected to time out. CPU time is that of the whole process, so it includes the threads left running.'''
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        func()
+    except exception_type:
+        pass
+    return time.perf_counter() - wall, time.process_time() - cpu
+
+
+def measure(calls: int, wait: float) -> List[Dict[str, Any]]:
+    from utils import timeout, TimeLimitReached, WrapType
+
+    stop = threading.Event()
+    condition = threading.Condition()
+    closure = lambda: _noop()  # noqa: E731
+    cases = [
+        # name, wrap type, trivial callable, callable that never finishes in time, arguments of the wrapper
+        ('signal', WrapType.SIGNAL, _noop, partial(stop.wait, wait * 5), {}),
+        ('async', WrapType.ASYNC, _noop, partial(stop.wait, wait * 5), {}),
+        ('future', WrapType.FUTURE, _noop, partial(stop.wait, wait * 5), {}),
+        ('process', WrapType.PROCESS, _noop, partial(time.sleep, wait * 5), {}),
+        ('process (fork)', WrapType.PROCESS, closure, None, {}),
+        ('timer', WrapType.TIMER, _noop_timer, _never_timer, {}),
+        ('timer (condition)', WrapType.TIMER, _noop_timer, _never_timer, {'condition': condition}),
+    ]
+    baseline = _mean_seconds(_noop, calls)
+    results = list()
+    for name, wrap_type, func, never, kwargs in cases:
+        wrapped = timeout(wait, TimeLimitReached, wrap_type)
+        result = {
+            'wrap_type': name,
+            'overhead_us': (_mean_seconds(partial(wrapped(func), **kwargs), calls) - baseline) * 1e6,
+            'wait_seconds': None,
+            'wait_cpu_seconds': None,
+        }
+        if never is not None:
+            result['wait_seconds'], result['wait_cpu_seconds'] = _cpu_while_waiting(
+                partial(wrapped(never), **kwargs), TimeLimitReached)
+        results.append(result)
+    # Let the threads abandoned by the timed out calls finish
+    stop.set()
+    return results
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m bench.timeouts', description='Per-call overhead of the timeout wrappers')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--wait', type=float, default=0.2, help='timeout of the calls that never finish')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> List[Dict[str, Any]]:
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    with Workspace(None, ()):
+        results = measure(options.calls, options.wait)
+        from utils import event_loop
+        event_loop.shutdown()
+
+    if options.json:
+        print(json.dumps(results, ensure_ascii=False, indent=4))
+    else:
+        print(f"{'方式':<20}{'单次开销 (μs)':>16}{'等待 (秒)':>12}{'等待中 CPU (秒)':>18}")
+        for result in results:
+            wait = '-' if result['wait_seconds'] is None else f"{result['wait_seconds']:.3f}"
+            cpu = '-' if result['wait_cpu_seconds'] is None else f"{result['wait_cpu_seconds']:.3f}"
+            print(f"{result['wrap_type']:<20}{result['overhead_us']:>16.1f}{wait:>12}{cpu:>18}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
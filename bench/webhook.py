@@ -0,0 +1,164 @@
+'''Webhook mode end to end against the fake Bot API.
+
+    python -m bench.webhook --updates 200
+
+Starts the bot's webhook listener through `start_updates`, as `main.py` does with `webhook_url` set, and posts updates to it like Telegram would:
+
+    wrong secret    a wrong `X-Telegram-Bot-Api-Secret-Token` is rejected with 403 and never reaches a handler
+    no secret       a request without the header is rejected with 403
+    wrong path      a request to another path is answered with 404
+    valid           the right secret is accepted with 200 and the update reaches the handler
+
+Then `--updates` valid updates are posted back to back and the time until all of them were handled is reported. Exits non-zero if any check fails.
+'''
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from typing import Any, Dict, List, Optional
+
+from .harness import Servers, Workspace, percentile
+
+
+__all__ = (
+    'main',
+)
+
+
+SECRET = 'bench-secret'
+PATH = '/telegram'
+
+
+def _update(update_id: int) -> Dict[str, Any]:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': -1003, 'type': 'supergroup', 'username': 'bench_webhook'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'bench'},
+            'text': f'webhook {update_id}',
+        },
+    }
+
+
+def post(port: int, path: str, update: Dict[str, Any], secret: Optional[str]) -> int:
+    '''Post `update` to the listener and return the status code.'''
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{port}{path}',
+        data=json.dumps(update).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    if secret is not None:
+        request.add_header('X-Telegram-Bot-Api-Secret-Token', secret)
+    try:
+        with urllib.request.urlopen(request) as resp:
+            return resp.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+def run(updates: int, servers: Servers) -> Dict[str, Any]:
+    from telegram import Update
+    from telegram.ext import CallbackContext, MessageHandler, Filters, Updater
+    from utils.bot import get_bot, update_workers
+    from utils.webhook import start_updates
+
+    handled: Dict[int, float] = dict()
+    lock = threading.Lock()
+    all_handled = threading.Event()
+
+    def on_message(update: Update, context: CallbackContext):
+        with lock:
+            handled[update.update_id] = time.perf_counter()
+            if len(handled) >= updates + 1:
+                all_handled.set()
+
+    updater = Updater(bot=get_bot(), use_context=True, workers=update_workers())
+    updater.dispatcher.add_handler(MessageHandler(Filters.all, on_message))
+    mode = start_updates(updater)
+    port = updater.httpd.server_address[1]
+    checks: Dict[str, bool] = dict()
+    try:
+        checks['webhook mode'] = mode == 'webhook'
+        webhook = servers.bot_api_stats()['webhook']
+        checks['setWebhook secret_token'] = webhook.get('secret_token') == SECRET
+        checks['wrong secret -> 403'] = post(port, PATH, _update(1), 'wrong') == 403
+        checks['no secret -> 403'] = post(port, PATH, _update(2), None) == 403
+        checks['wrong path -> 404'] = post(port, '/elsewhere', _update(3), SECRET) == 404
+        checks['valid -> 200'] = post(port, PATH, _update(4), SECRET) == 200
+
+        start = time.perf_counter()
+        sent: Dict[int, float] = dict()
+        statuses: List[int] = list()
+        for update_id in range(100, 100 + updates):
+            sent[update_id] = time.perf_counter()
+            statuses.append(post(port, PATH, _update(update_id), SECRET))
+        all_handled.wait(timeout=30)
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            checks['valid update handled'] = 4 in handled
+            checks['rejected updates not handled'] = not {1, 2, 3} & set(handled)
+            checks['all valid updates handled'] = all(update_id in handled for update_id in sent)
+            latencies = [handled[update_id] - sent[update_id] for update_id in sent if update_id in handled]
+        checks['all valid updates -> 200'] = all(status == 200 for status in statuses)
+    finally:
+        updater.stop()
+
+    return {
+        'checks': checks,
+        'failed': [name for name, ok in checks.items() if not ok],
+        'updates': updates,
+        'seconds': elapsed,
+        'updates_per_second': updates / elapsed if elapsed else 0.0,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p99': percentile(latencies, 99),
+    }
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m bench.webhook', description='Webhook mode against the fake Bot API')
+    parser.add_argument('--updates', type=int, default=200, help='valid updates posted after the checks')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the Bot API takes per call')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    parser.add_argument('--verbose', action='store_true', help='keep the logs of the bot')
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    config = {
+        'webhook_url': f'https://bench.invalid{PATH}',
+        'webhook_listen': '127.0.0.1',
+        # Any free port, read back from the listener
+        'webhook_port': 0,
+        'webhook_path': PATH,
+        'webhook_secret_token': SECRET,
+    }
+    with Servers(options.latency) as servers, Workspace(servers, (), config):
+        import utils.webhook  # noqa: F401
+        if not options.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+            logging.getLogger('push_helper').setLevel(logging.WARNING)
+        result = run(options.updates, servers)
+
+    if options.json:
+        print(json.dumps(result, ensure_ascii=False, indent=4))
+    else:
+        for name, ok in result['checks'].items():
+            print(f"    {'通过' if ok else '失败'}: {name}")
+        print(f"{result['updates']} 条更新, 用时 {result['seconds']:.2f} 秒, {result['updates_per_second']:.1f} 条/秒")
+        print(f"    延迟: p50 {result['latency_p50']:.4f} 秒, p99 {result['latency_p99']:.4f} 秒")
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main()['failed'] else 0)
@@ -11,6 +11,7 @@ from types import ModuleType
 from typing import Dict
 
 from utils import get_filter
+from utils.outbound import scheduler
 
 
 submodules: Dict[str, ModuleType] = {
@@ -24,7 +25,8 @@ def describe():
 
 
 def run(update: Update, context: CallbackContext):
-    update.effective_message.reply_text(
+    scheduler.call(
+        update.effective_chat.id, update.effective_message.reply_text,
         text="所有指令如下:\n"
         + "\n".join(
             [f"/{command}: {description}"
@@ -8,28 +8,20 @@ from telegram.ext import (
     Filters,
     run_async,
 )
-from functools import partial, reduce
 
 import utils
 import utils.push as push
 
+from utils.admins import admin_filter
+from utils.bot import get_bot
+from utils.outbound import scheduled
+
 
 logger = logging.getLogger('push_helper')
 
 
-def get_filter(bot: Bot):
-    return (
-        utils.get_filter(utils.Config.watchers)
-        & Filters.user(
-            user_id=reduce(
-                frozenset.union, map(
-                    frozenset, map(
-                        partial(utils.get_admin, bot), utils.Config.watchers
-                    )
-                )
-            )
-        )
-    )
+def get_filter():
+    return utils.get_filter(utils.Config.watchers) & admin_filter
 
 
 def describe():
@@ -37,7 +29,7 @@ def describe():
 
 
 def run(update: Update, context: CallbackContext):
-    bot = Bot(token=utils.Config.token)
+    bot = scheduled(get_bot())
     chat = update.effective_chat
     chat_id = chat.id
     command_message_id = update.effective_message.message_id
@@ -59,8 +51,7 @@ def run(update: Update, context: CallbackContext):
 
 def register(updater: Updater):
     dp = updater.dispatcher
-    bot = updater.bot
 
     dp.add_handler(CommandHandler(
-        __name__, run, filters=get_filter(bot), run_async=True))
+        __name__, run, filters=get_filter(), run_async=True))
     # dp.add_handler(CommandHandler(__name__, run, filters=Filters.all)) # DEBUG
@@ -9,11 +9,12 @@ from telegram.ext import (
 )
 from typing import List, Any, Callable, Sequence
 from telegram import Update, Bot
-from functools import partial, reduce
 
 import utils
 
 from utils import user_format
+from utils.admins import admin_filter
+from utils.outbound import scheduler
 
 
 logger = logging.getLogger('push_helper')
@@ -23,19 +24,8 @@ def describe():
     return "将当前监视器群组在 config 中的的记录方式改为 ID"
 
 
-def get_filter(bot: Bot):
-    return (
-        utils.get_filter(utils.Config.watchers)
-        & Filters.user(
-            user_id=reduce(
-                frozenset.union, map(
-                    frozenset, map(
-                        partial(utils.get_admin, bot), utils.Config.watchers
-                    )
-                )
-            )
-        )
-    )
+def get_filter():
+    return utils.get_filter(utils.Config.watchers) & admin_filter
 
 
 def manipulated_if(seq: Sequence[Any], pred: Callable[[Any], Any], manip: Callable[[Any], Any]) -> Sequence[Any]:
@@ -65,7 +55,8 @@ def run(update: Update, context: CallbackContext):
     except ValueError:
         pass
 
-    update.effective_message.reply_text(
+    scheduler.call(
+        chat.id, update.effective_message.reply_text,
         text="成功: 已将此频道/群组的记录方式改为 ID",
         quote=True
     )
@@ -74,8 +65,7 @@ def run(update: Update, context: CallbackContext):
 
 def register(updater: Updater):
     dp = updater.dispatcher
-    bot = updater.bot
 
     dp.add_handler(CommandHandler(
-        __name__, run, filters=get_filter(bot), run_async=True))
+        __name__, run, filters=get_filter(), run_async=True))
     # dp.add_handler(CommandHandler(__name__, run, filters=Filters.all)) # DEBUG
@@ -1,4 +1,5 @@
 import logging
+import time
 
 from telegram import Update, Bot
 from telegram.ext import (
@@ -8,30 +9,21 @@ from telegram.ext import (
     Filters,
     run_async,
 )
-from functools import partial, reduce
 
 import utils
 import utils.push as push
 
 from markup import main_buttons
+from utils.admins import admin_filter
+from utils.bot import get_bot
+from utils.outbound import scheduler
 
 
 logger = logging.getLogger('push_helper')
 
 
-def get_filter(bot: Bot):
-    return (
-        utils.get_filter(utils.Config.watchers)
-        & Filters.user(
-            user_id=reduce(
-                frozenset.union, map(
-                    frozenset, map(
-                        partial(utils.get_admin, bot), utils.Config.watchers
-                    )
-                )
-            )
-        )
-    )
+def get_filter():
+    return utils.get_filter(utils.Config.watchers) & admin_filter
 
 
 def describe():
@@ -39,34 +31,54 @@ def describe():
 
 
 def run(update: Update, context: CallbackContext):
-    editor_bot = Bot(token=utils.Config.token)
+    editor_bot = get_bot()
+    chat_id = update.effective_chat.id
+    start_time = time.perf_counter()
 
     if not push.waiting_to_push:
-        update.effective_message.reply_text(text="推送队列为空", quote=True)
+        scheduler.call(chat_id, update.effective_message.reply_text, text="推送队列为空", quote=True)
         return
 
     waiting_to_push = dict(push.waiting_to_push)
     push.waiting_to_push.clear()  # SaltyFish: My fault.
     logger.info(f"推送全部内容")
-    update.effective_message.reply_text(text="开始推送队列中全部内容", quote=True)
+    scheduler.call(chat_id, update.effective_message.reply_text, text="开始推送队列中全部内容", quote=True)
     targets_additional, tags_additional = list(), list()
     for arg in context.args:
         if arg[0] == "@":
             targets_additional.append(arg)
         else:
             tags_additional.append(arg)
-    for message_id, message in waiting_to_push.items():
-        message.push(targets_additional, tags_additional)
-        editor_bot.edit_message_reply_markup(
-            chat_id=update.effective_chat.id,
+    message_ids = list(waiting_to_push.keys())
+    edits = list()
+
+    def on_pushed(index: int):
+        # Keyboards are edited as soon as their message is done, without waiting for the edit
+        message_id = message_ids[index]
+        edits.append(scheduler.submit(
+            chat_id,
+            editor_bot.edit_message_reply_markup,
+            chat_id=chat_id,
             message_id=message_id,
             reply_markup=main_buttons(message_id)
-        )
+        ))
+
+    push.push_all(list(waiting_to_push.values()),
+                  targets_additional, tags_additional, on_pushed)
+    for edit in edits:
+        try:
+            edit.result()
+        except Exception:
+            logger.exception(f"错误: 无法编辑Markup")
+
+    elapsed = time.perf_counter() - start_time
+    logger.info(f"推送 {len(message_ids)} 条消息用时 {elapsed:.2f} 秒")
+    scheduler.call(chat_id, update.effective_message.reply_text,
+                   text=f"推送完成: 共 {len(message_ids)} 条消息, 用时 {elapsed:.2f} 秒", quote=True)
 
 
 def register(updater: Updater):
     dp = updater.dispatcher
-    bot = updater.bot
 
     dp.add_handler(CommandHandler(
-        __name__, run, filters=get_filter(bot), run_async=True))
+        __name__, run, filters=get_filter(), run_async=True))
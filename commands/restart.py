@@ -5,25 +5,15 @@ import os
 import sys
 import logging
 from threading import Thread
-from functools import partial, reduce
+from utils.admins import admin_filter
+from utils.outbound import scheduler
 
 
 logger = logging.getLogger('push_helper')
 
 
-def get_filter(bot: Bot):
-    return (
-        utils.get_filter(utils.Config.watchers)
-        & Filters.user(
-            user_id=reduce(
-                frozenset.union, map(
-                    frozenset, map(
-                        partial(utils.get_admin, bot), utils.Config.watchers
-                    )
-                )
-            )
-        )
-    )
+def get_filter():
+    return utils.get_filter(utils.Config.watchers) & admin_filter
 
 
 def describe():
@@ -35,16 +25,17 @@ def register(updater: Updater):
         #print(context) # DEBUG
         def stop_and_restart():
             updater.stop()
+            # exec skips atexit, so config dumps still waiting to be written must go out now
+            utils.BaseConfig.flush()
             os.execl(sys.executable, sys.executable, *sys.argv,
                      "--restart", str(update.effective_chat.id))
 
-        update.effective_message.reply_text(text="正在重启bot...")
+        scheduler.call(update.effective_chat.id, update.effective_message.reply_text, text="正在重启bot...")
         logger.info(f"正在重启 Bot")
         Thread(target=stop_and_restart).start()
 
     dp = updater.dispatcher
-    bot = updater.bot
 
     dp.add_handler(CommandHandler(
-        __name__, run, filters=get_filter(bot), run_async=True))
+        __name__, run, filters=get_filter(), run_async=True))
     # dp.add_handler(CommandHandler(__name__, run, filters=Filters.all)) # DEBUG
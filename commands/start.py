@@ -14,28 +14,20 @@ from telegram.ext import (
     Filters,
     run_async,
 )
-from functools import partial, reduce
 
 import utils
 import utils.push as push
 
+from utils.admins import admin_filter
+from utils.bot import get_bot
+from utils.outbound import scheduled, scheduler
+
 
 logger = logging.getLogger('push_helper')
 
 
-def get_filter(bot: Bot):
-    return (
-        utils.get_filter(utils.Config.watchers)
-        & Filters.user(
-            user_id=reduce(
-                frozenset.union, map(
-                    frozenset, map(
-                        partial(utils.get_admin, bot), utils.Config.watchers
-                    )
-                )
-            )
-        )
-    )
+def get_filter():
+    return utils.get_filter(utils.Config.watchers) & admin_filter
 
 
 def do_you_have_time_markup(username: str) -> InlineKeyboardMarkup:
@@ -59,7 +51,7 @@ def vtb_suggestion_markup() -> InlineKeyboardMarkup:
 
 
 def suggest_vtb(update: Update, context: CallbackContext):
-    bot = Bot(token=utils.Config.token)
+    bot = scheduled(get_bot())
     bot.edit_message_text("请了解一下我们的推：", chat_id=update.effective_chat.id,
                           message_id=update.effective_message.message_id)
     bot.edit_message_reply_markup(chat_id=update.effective_chat.id,
@@ -73,7 +65,8 @@ def describe():
 def run(update: Update, context: CallbackContext):
     command_message = update.effective_message
 
-    command_message.reply_text(
+    scheduler.call(
+        command_message.chat_id, command_message.reply_text,
         text="爷还活着, 大概吧",
         reply_markup=do_you_have_time_markup(
             f"@{update.effective_user.username}"),
@@ -83,10 +76,9 @@ def run(update: Update, context: CallbackContext):
 
 def register(updater: Updater):
     dp = updater.dispatcher
-    bot = updater.bot
 
     dp.add_handler(CommandHandler(
-        __name__, run, filters=get_filter(bot), run_async=True))
+        __name__, run, filters=get_filter(), run_async=True))
     dp.add_handler(CallbackQueryHandler(
         suggest_vtb, pattern="have_time", run_async=True))
     # dp.add_handler(CommandHandler(__name__, run, filters=Filters.all)) # DEBUG
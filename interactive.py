@@ -1,10 +1,12 @@
 from telegram.ext import run_async
 from utils import (
     MetaConfig,
+    collect_stats,
     timeout,
     WrapType,
 )
 
+import utils.metrics as metrics
 import utils.push as push
 
 
@@ -20,6 +22,18 @@ def command(command: str, *args) -> None:
                     print(f"No config named {name!r}")
             else:
                 print(repr(config_ref()))
+    elif command == 'stats':
+        for name, stats in collect_stats(args or None).items():
+            print(f"{name}:")
+            for key, value in stats.items():
+                print(f"    {key}: {value}")
+    elif command == 'metrics':
+        for name, series in metrics.summary().items():
+            if args and name not in args:
+                continue
+            print(f"{name}:")
+            for labels, value in series.items():
+                print(f"    {labels}: {value}")
     elif command == 'list':
         for ref in MetaConfig.configs().values():
             print(repr(ref()))
@@ -1,10 +1,12 @@
 #! /usr/bin/env python3.8
 
+import time
+started = time.monotonic()
+
 import logging
-import os
 import sys
 
-from importlib import import_module
+from threading import Thread
 from signal import SIGINT, SIGTERM, SIGABRT, signal
 from functools import wraps
 from telegram import Update
@@ -12,12 +14,13 @@ from telegram.ext import Updater, CallbackContext
 
 from utils import (
     Config,
+    event_loop,
+    startup,
     timeout,
     WrapType,
     TimeLimitReached,
 )
-from markup import main_buttons
-from interactive import handle  # DEBUG
+startup.begin(started)
 
 # > For future use: multiprocessing demand
 #import telegram.ext.updater
@@ -26,7 +29,7 @@ from interactive import handle  # DEBUG
 # <
 
 submodules = {
-    name: import_module(name)
+    name: startup.timed_import(name)
     for name in [
         'commands',
         'auto_forward',
@@ -34,6 +37,15 @@ submodules = {
     ]
 }
 
+from utils.admins import admins
+from utils.bot import get_bot, update_workers
+from utils.outbound import scheduled
+from utils import metrics
+from utils.recorder import recorder
+from utils.webhook import start_updates
+from utils.push import router
+from interactive import handle  # DEBUG
+
 # >
 
 
@@ -63,17 +75,36 @@ def error(update: Update, context: CallbackContext):
     logger.exception(f"更新 {update} 导致了错误: {error}")
 
 
+def warm_up():
+    '''Load the Pixiv backend and log in ahead of the first push, without holding up startup.'''
+    def run():
+        if (backend := router.backend("pixiv")) is not None and backend.warm_up is not None:
+            backend.warm_up()
+
+    Thread(target=run, name="warm_up", daemon=True).start()
+
+
 if __name__ == "__main__":
     updater: Updater = Updater(
-        token=Config.token, use_context=True, workers=len(os.sched_getaffinity(0))*2)
+        bot=get_bot(), use_context=True, workers=update_workers())
 
     for submodule in submodules.values():
         submodule.register(updater)
 
     dp = updater.dispatcher
     dp.add_error_handler(error)
-
-    updater.start_polling()
+    admins.register(dp)
+    admins.start(updater.bot)
+    recorder.register(dp)
+    recorder.record_admins(admins.ids())
+    event_loop.bind_updater(updater)
+    metrics.gauge("dispatcher_queue_depth", "Updates waiting for the dispatcher").set_function(updater.update_queue.qsize)
+    metrics.serve()
+
+    startup.watch_first_poll(warm_up)
+    startup.mark('start_updates')
+    if start_updates(updater) == 'webhook':
+        startup.ready('webhook_ready')
     logger.info(f"Bot @{updater.bot.get_me().username} 已启动")
     try:
         if sys.argv[-2] != "--restart":
@@ -81,6 +112,6 @@ if __name__ == "__main__":
     except:
         pass
     else:
-        updater.bot.send_message(chat_id=int(sys.argv[-1]), text="重启完毕")
+        scheduled(updater.bot).send_message(chat_id=int(sys.argv[-1]), text="重启完毕")
 
     updater.idle()
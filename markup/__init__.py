@@ -1,5 +1,4 @@
 import re
-import time
 import logging
 
 from telegram import (
@@ -23,9 +22,12 @@ from telegram.ext import (
 from telegram.error import BadRequest
 from typing import Dict, Callable
 from functools import wraps
-from queue import Queue, Empty
 
 from utils import Config, get_filter, timeout, TimeLimitReached, WrapType
+from utils.bot import get_bot
+from utils.metrics import stage_seconds
+from utils.outbound import scheduled
+from utils.replies import replies
 
 import utils
 import utils.push as push
@@ -37,6 +39,7 @@ from .auto_select import *
 logger = logging.getLogger('push_helper')
 
 
+@ stage_seconds.time(stage="parse_url", backend="")
 def parse_url(message: Message):
     text = message.text
 
@@ -70,22 +73,6 @@ def into_push_list(f: Callable):
     return wrapped
 
 
-def get_reply(message: Message, update_queue: Queue, timeout: float) -> Message:
-    now = time.perf_counter
-    deadline = now() + timeout
-    while now() <= deadline:
-        try:
-            update = update_queue.get(block=True, timeout=deadline-now())
-        except Empty:
-            continue
-        update_queue.task_done()
-        if update.message and update.message.reply_to_message == message:
-            return update.message
-        else:
-            update_queue.put_nowait(update)
-    raise TimeLimitReached(f"Reached given time limit {timeout}s")
-
-
 def no(*args, **kwargs):
     pass
 
@@ -194,7 +181,7 @@ def update_tag(update: Update, context: CallbackContext):
     data = callback.data
     chat_id = message.chat.id
     username = callback.from_user.username
-    editor_bot = Bot(token=Config.token)
+    editor_bot = scheduled(get_bot())
 
     def self_define():
         original_message = editor_bot.send_message(
@@ -205,16 +192,16 @@ def update_tag(update: Update, context: CallbackContext):
             reply_markup=ForceReply(selective=True)
         )
         try:
-            replied_message = get_reply(
-                original_message, context.update_queue, timeout=5)
+            replied_message = replies.wait(original_message)
         except TimeLimitReached:
             logger.exception(f"错误: 自定义回复超时")
         else:
             push.waiting_to_push[message_id].customized_tags.append(
                 replied_message.text)
-            replied_message.delete()
+            push.waiting_to_push.save(message_id)
+            editor_bot.delete_message(chat_id=chat_id, message_id=replied_message.message_id)
         finally:
-            original_message.delete()
+            editor_bot.delete_message(chat_id=chat_id, message_id=original_message.message_id)
 
     callback.answer()
     if not re.search(regex.sub, data):
@@ -224,6 +211,7 @@ def update_tag(update: Update, context: CallbackContext):
                 push.waiting_to_push[message_id].tag_indices.remove(tag_index)
             except KeyError:
                 push.waiting_to_push[message_id].tag_indices.add(tag_index)
+            push.waiting_to_push.save(message_id)
 
         else:
             try:
@@ -232,9 +220,12 @@ def update_tag(update: Update, context: CallbackContext):
                 self_define()
             else:
                 push.waiting_to_push[message_id].customized_tags.pop(tag_index)
+                push.waiting_to_push.save(message_id)
 
     try:
-        message.edit_reply_markup(
+        editor_bot.edit_message_reply_markup(
+            chat_id=chat_id,
+            message_id=message_id,
             reply_markup=tag_buttons(message_id)
         )
     except BadRequest as exc:
@@ -251,7 +242,7 @@ def update_target(update: Update, context: CallbackContext):
     message_id = message.message_id
     data = callback.data
     chat_id = message.chat.id
-    editor_bot = Bot(token=Config.token)
+    editor_bot = scheduled(get_bot())
 
     callback.answer()
     if not re.search(regex.sub, data):
@@ -261,9 +252,12 @@ def update_target(update: Update, context: CallbackContext):
                 target_index)
         except KeyError:
             push.waiting_to_push[message_id].target_indices.add(target_index)
+        push.waiting_to_push.save(message_id)
 
     try:
-        message.edit_reply_markup(
+        editor_bot.edit_message_reply_markup(
+            chat_id=chat_id,
+            message_id=message_id,
             reply_markup=target_buttons(message_id)
         )
     except BadRequest as exc:
@@ -279,11 +273,13 @@ def update_return(update: Update, context: CallbackContext):
     message = callback.message
     message_id = message.message_id
     chat_id = message.chat.id
-    editor_bot = Bot(token=Config.token)
+    editor_bot = scheduled(get_bot())
 
     callback.answer()
     try:
-        message.edit_reply_markup(
+        editor_bot.edit_message_reply_markup(
+            chat_id=chat_id,
+            message_id=message_id,
             reply_markup=main_buttons(message_id)
         )
     except BadRequest as exc:
@@ -300,7 +296,7 @@ def update_message(update: Update, context: CallbackContext):
     message_id = message.message_id
     chat_id = message.chat.id
     text = message.text
-    editor_bot = Bot(token=Config.token)
+    editor_bot = scheduled(get_bot())
 
     callback.answer()
     if message_id in push.waiting_to_push:
@@ -308,7 +304,9 @@ def update_message(update: Update, context: CallbackContext):
     else:
         into_push_list(no)(update, context)
     try:
-        message.edit_reply_markup(
+        editor_bot.edit_message_reply_markup(
+            chat_id=chat_id,
+            message_id=message_id,
             reply_markup=main_buttons(message_id)
         )
     except BadRequest as exc:
@@ -323,7 +321,8 @@ def push_single(update: Update, context: CallbackContext):
     callback = update.callback_query
     message = callback.message
     message_id = message.message_id
-    editor_bot = Bot(token=Config.token)
+    chat_id = message.chat.id
+    editor_bot = scheduled(get_bot())
     # try:
     #message_to_push = push.waiting_to_push[message_id]
     # except:
@@ -336,7 +335,9 @@ def push_single(update: Update, context: CallbackContext):
     update.callback_query.answer(f"开始推送单条消息, id: {message_id}")
     push.waiting_to_push.pop(message_id)
     try:
-        message.edit_reply_markup(
+        editor_bot.edit_message_reply_markup(
+            chat_id=chat_id,
+            message_id=message_id,
             reply_markup=main_buttons(message_id)
         )
     except BadRequest as exc:
@@ -350,9 +351,11 @@ def add_keyboard(update: Update, context: CallbackContext):
     message = update.effective_message
     message_id = message.message_id
     chat_id = message.chat.id
-    editor_bot = Bot(token=Config.token)
+    editor_bot = scheduled(get_bot())
     try:
-        message.edit_reply_markup(
+        editor_bot.edit_message_reply_markup(
+            chat_id=chat_id,
+            message_id=message_id,
             reply_markup=main_buttons(message_id)
         )
     except BadRequest as exc:
@@ -373,11 +376,13 @@ def register(updater: Updater):
     filter_reply = Filters.reply
 
     dp = updater.dispatcher
+    replies.register(dp)
     dp.add_handler(MessageHandler(filter_user & filter_command, no))
     dp.add_handler(MessageHandler(
         filter_user & ~ filter_command & ~ filter_reply, add_keyboard))
     #dp.add_handler(MessageHandler(Filters.all, add_keyboard))
-    dp.add_handler(CallbackQueryHandler(update_tag, pattern=regex.tag))
+    # Waits for the reply to a custom tag prompt, which the dispatcher has to stay free to deliver
+    dp.add_handler(CallbackQueryHandler(update_tag, pattern=regex.tag, run_async=True))
     dp.add_handler(CallbackQueryHandler(update_target, pattern=regex.target))
     dp.add_handler(CallbackQueryHandler(update_return, pattern=regex.ret))
     dp.add_handler(CallbackQueryHandler(update_message, pattern=regex.select))
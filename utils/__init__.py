@@ -23,6 +23,7 @@ from collections.abc import Iterable as IterableType
 
 from .timeout_wrapper import *
 from .config import *
+from .stats import *
 
 
 __all__ = (
@@ -39,6 +40,7 @@ __all__ = (
     )
     + timeout_wrapper.__all__
     + config.__all__
+    + stats.__all__
 )
 
 
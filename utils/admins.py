@@ -0,0 +1,139 @@
+import logging
+import threading
+
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from telegram import Bot, ChatMember, Message, Update
+from telegram.ext import CallbackContext, ChatMemberHandler, Dispatcher, MessageFilter
+
+from .config import BaseConfig, Config, User, user_format
+from .stats import register_stats
+
+
+__all__ = (
+    'AdminConfig',
+    'AdminRegistry',
+    'admins',
+    'admin_filter',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+
+class AdminConfig(BaseConfig, config_file="push_config.json"):
+    admin_refresh_interval: Optional[float] = 3600.0
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+_ADMIN_STATUS = (ChatMember.ADMINISTRATOR, ChatMember.CREATOR)
+
+
+class AdminRegistry:
+    '''The administrators of all watchers, fetched concurrently and kept up to date in the background.
+
+    Membership checks read a frozen set that is swapped as a whole, so they take no lock.
+    '''
+
+    def __init__(self, watchers: Callable[[], Iterable[User]], interval: float):
+        self.__watchers = watchers
+        self.__interval = interval
+        self.__bot: Optional[Bot] = None
+        self.__by_chat: Dict[User, FrozenSet[int]] = dict()
+        self.__all: FrozenSet[int] = frozenset()
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__refreshes = 0
+        self.__failures = 0
+        self.__member_updates = 0
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self.__all
+
+    def ids(self) -> FrozenSet[int]:
+        return self.__all
+
+    def __fetch(self, chat: User) -> Tuple[User, Optional[FrozenSet[int]]]:
+        try:
+            return chat, frozenset(admin.user.id for admin in self.__bot.get_chat_administrators(chat))
+        except Exception:
+            self.__failures += 1
+            logger.exception(f"获取 {chat} 的管理员失败")
+            return chat, None
+
+    def refresh(self) -> None:
+        watchers = list(self.__watchers())
+        if not watchers:
+            return
+        with ThreadPoolExecutor(max_workers=len(watchers), thread_name_prefix='admins') as pool:
+            results = list(pool.map(self.__fetch, watchers))
+        with self.__lock:
+            previous = self.__by_chat
+            # Keep the last known admins of a chat that could not be fetched this time
+            self.__by_chat = {
+                chat: admins if admins is not None else previous.get(chat, frozenset())
+                for chat, admins in results
+            }
+            self.__all = frozenset().union(*self.__by_chat.values())
+        self.__refreshes += 1
+
+    def __run(self):
+        while not self.__stopped.wait(self.__interval):
+            self.refresh()
+
+    def start(self, bot: Bot) -> None:
+        '''Fetch the admins once, then keep refreshing them every `admin_refresh_interval` seconds.'''
+        self.__bot = bot
+        self.refresh()
+        if self.__interval > 0:
+            threading.Thread(target=self.__run, name='admins', daemon=True).start()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+
+    def on_chat_member(self, update: Update, context: CallbackContext) -> None:
+        member = update.chat_member
+        chat = member.chat
+        with self.__lock:
+            for watcher in self.__by_chat:
+                if watcher == chat.id or (chat.username and watcher == user_format(chat.username)):
+                    break
+            else:
+                return
+            user_id = member.new_chat_member.user.id
+            if member.new_chat_member.status in _ADMIN_STATUS:
+                self.__by_chat[watcher] = self.__by_chat[watcher] | {user_id}
+            else:
+                self.__by_chat[watcher] = self.__by_chat[watcher] - {user_id}
+            self.__all = frozenset().union(*self.__by_chat.values())
+        self.__member_updates += 1
+
+    def register(self, dispatcher: Dispatcher) -> None:
+        dispatcher.add_handler(ChatMemberHandler(
+            self.on_chat_member, ChatMemberHandler.CHAT_MEMBER), group=-1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'chats': len(self.__by_chat),
+            'admins': len(self.__all),
+            'refreshes': self.__refreshes,
+            'failures': self.__failures,
+            'member_updates': self.__member_updates,
+        }
+
+
+class _AdminFilter(MessageFilter):
+    def __init__(self, registry: AdminRegistry):
+        self.registry = registry
+        self.name = 'admin_filter'
+
+    def filter(self, message: Message) -> bool:
+        return message.from_user is not None and message.from_user.id in self.registry
+
+
+admins = AdminRegistry(lambda: Config.watchers, AdminConfig.admin_refresh_interval)
+admin_filter = _AdminFilter(admins)
+register_stats('admins', admins.stats)
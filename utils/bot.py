@@ -0,0 +1,83 @@
+import os
+import threading
+
+from typing import Any, Dict, Optional, Tuple
+from telegram import Bot
+from telegram.utils.request import Request
+
+from .config import BaseConfig, Config
+from .stats import register_stats
+
+
+__all__ = (
+    'BotConfig',
+    'update_workers',
+    'get_bot',
+)
+
+
+class BotConfig(BaseConfig, config_file="push_config.json"):
+    update_workers: Optional[int] = 0       # 0: twice the number of usable CPUs
+    bot_read_timeout: Optional[float] = 5.0
+    bot_api_base_url: Optional[str] = str()     # e.g. a local Bot API server, empty for api.telegram.org
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+def update_workers() -> int:
+    '''Worker threads of the dispatcher.'''
+    return BotConfig.update_workers or len(os.sched_getaffinity(0)) * 2
+
+
+def _pool_size() -> int:
+    # Lazy import, the outbound scheduler is built from its own config
+    from .outbound import OutboundConfig
+    # Every thread that may talk to the Bot API at the same time needs its own connection:
+    # dispatcher workers, outbound senders, and a few for polling, the admin registry and the console
+    return update_workers() + OutboundConfig.send_workers + 4
+
+
+_bot: Optional[Bot] = None
+_request: Optional[Request] = None
+_lock = threading.Lock()
+
+
+def get_bot() -> Bot:
+    '''The one `Bot` of this process, so that all calls share one pool of keep-alive connections to the Bot API.'''
+    global _bot, _request
+    if _bot is None:
+        with _lock:
+            if _bot is None:
+                _request = Request(con_pool_size=_pool_size(), read_timeout=BotConfig.bot_read_timeout)
+                _bot = Bot(
+                    token=Config.token,
+                    base_url=BotConfig.bot_api_base_url or None,
+                    request=_request,
+                )
+    return _bot
+
+
+def bot_stats() -> Dict[str, Any]:
+    if _request is None:
+        return {'pool_size': 0}
+    ret = {
+        'pool_size': _request.con_pool_size,
+        'connections_opened': 0,
+        'connections_idle': 0,
+        'requests': 0,
+    }
+    # Counters of the urllib3 pools behind the request object, one pool per host
+    pools = getattr(getattr(_request, '_con_pool', None), 'pools', None)
+    for key in (pools.keys() if pools is not None else ()):
+        if (pool := pools.get(key)) is None:
+            continue
+        ret['connections_opened'] += getattr(pool, 'num_connections', 0)
+        ret['requests'] += getattr(pool, 'num_requests', 0)
+        if (idle := getattr(pool, 'pool', None)) is not None:
+            ret['connections_idle'] += sum(conn is not None for conn in list(idle.queue))
+    return ret
+
+
+register_stats('bot', bot_stats)
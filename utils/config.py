@@ -1,6 +1,11 @@
 from __future__ import annotations
 
+import atexit
 import json
+import os
+import stat
+import tempfile
+import threading
 import weakref
 
 from typing import (
@@ -19,9 +24,11 @@ from inspect import isfunction, ismethod
 from warnings import warn
 from functools import reduce
 from os import PathLike
-from os.path import abspath
+from os.path import abspath, basename, dirname
 from collections.abc import Iterable as IterableType
 
+from .stats import register_stats
+
 
 __all__ = (
     'indent',
@@ -174,6 +181,107 @@ class MetaConfig(type):
         return name in self.__items_name
 
 
+class _ConfigWriter:
+    '''Persists config items, replacing the file atomically and coalescing dumps that come in quick succession.
+
+    The items of a dump are merged into what the file holds at the time of writing, so keys of other configs and edits made in between are kept. The new content goes to a temporary file in the same directory that then replaces the file, so a crash leaves either the old or the new config. Nothing is written if the merged content equals the current one.
+    '''
+
+    def __init__(self, delay: float):
+        self.__delay = delay
+        self.__pending: Dict[str, Dict[str, Any]] = dict()
+        self.__timers: Dict[str, threading.Timer] = dict()
+        self.__lock = threading.Lock()
+
+        self.__writes = 0
+        self.__unchanged = 0
+        self.__coalesced = 0
+
+    @ staticmethod
+    def __read(path: str) -> Dict[str, Any]:
+        try:
+            with open(path, 'r', encoding='utf8') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @ staticmethod
+    def __replace(path: str, data: Dict[str, Any]):
+        fd, temp_path = tempfile.mkstemp(prefix=f'.{basename(path)}.', suffix='.tmp', dir=dirname(path))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf8') as file:
+                json.dump(data, file, ensure_ascii=False, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            try:
+                os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode))
+            except FileNotFoundError:
+                pass
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def write(self, path: File, items: Dict[str, Any], base: Optional[Dict[str, Any]] = None, delay: Optional[float] = None) -> None:
+        '''Merge `items` into the file at `path`, after `delay` seconds without further writes to it, or at once for 0.
+
+        `base` is the current content of the file if the caller has just read it.
+        '''
+        path = abspath(str(path))
+        delay = self.__delay if delay is None else delay
+        with self.__lock:
+            if path in self.__pending:
+                self.__coalesced += 1
+            self.__pending.setdefault(path, dict()).update(items)
+            if (timer := self.__timers.pop(path, None)) is not None:
+                timer.cancel()
+            if delay <= 0:
+                self.__flush(path, base)
+            else:
+                timer = self.__timers[path] = threading.Timer(delay, self.flush, (path,))
+                timer.daemon = True
+                timer.start()
+
+    def __flush(self, path: str, base: Optional[Dict[str, Any]] = None):
+        items = self.__pending.pop(path, None)
+        if items is None:
+            return
+        current = self.__read(path) if base is None else base
+        data = dict(current)
+        data.update(items)
+        # Compare as JSON, e.g. tuples of the config are lists in the file
+        if os.path.exists(path) and json.loads(json.dumps(data)) == current:
+            self.__unchanged += 1
+            return
+        self.__replace(path, data)
+        self.__writes += 1
+
+    def flush(self, path: Optional[File] = None) -> None:
+        '''Write out pending items now, of `path` or of all files.'''
+        with self.__lock:
+            paths = list(self.__pending) if path is None else [abspath(str(path))]
+            for path in paths:
+                if (timer := self.__timers.pop(path, None)) is not None:
+                    timer.cancel()
+                self.__flush(path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pending': len(self.__pending),
+            'writes': self.__writes,
+            'unchanged': self.__unchanged,
+            'coalesced': self.__coalesced,
+        }
+
+
+# Seconds to wait for further changes before writing a dumped config
+_DUMP_DELAY = 1.0
+
+_writer = _ConfigWriter(_DUMP_DELAY)
+atexit.register(_writer.flush)
+register_stats('config', _writer.stats)
+
+
 class BaseConfig(metaclass=MetaConfig):
     __registered: Dict[str, Dict[MetaConfig, FrozenSet[str]]] = {}
 
@@ -241,33 +349,33 @@ class BaseConfig(metaclass=MetaConfig):
                         f"{' '.join(map(repr, intersect))} in class {cls.__qualname__}."
                     )
 
-        with open(path, 'a+'):
-            pass
-        with open(path, 'r', encoding='utf8') as file:
-            try:
+        try:
+            with open(path, 'r', encoding='utf8') as file:
                 data = json.load(file)
-            except:
-                data = None
+        except:
+            data = None
         cls.from_json(data)
         cls._config_file = path
-        cls.dump(data=data)
+        # Only fills in missing items, so the file is rarely touched on start
+        cls.dump(data=data if data is not None else {}, delay=0)
 
     @ classmethod
-    def dump(cls, path: Optional[File] = None, *, data: Dict[str, Any] = None):
+    def dump(cls, path: Optional[File] = None, *, data: Dict[str, Any] = None, delay: Optional[float] = None):
+        '''Save the items of this config into `path`, merged with the other content of the file.
+
+        The file is replaced atomically, `delay` seconds (one by default) after the last of several dumps in a row, and left alone if nothing changed. `data` is the current content of the file if it has just been read, which makes the write immediate.
+        '''
         if path is None:
             try:
                 path = cls._config_file
             except:
                 raise ValueError(f"No file path given while {cls.__qualname__!r} is not initiated with a config file.")
-        if data is None:
-            with open(path, 'r') as file:
-                try:
-                    data = json.load(file)
-                except json.JSONDecodeError:
-                    data = {}
-        data.update(cls.json())
-        with open(path, 'w', encoding='utf8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
+        _writer.write(path, cls.json(), base=data, delay=0 if data is not None else delay)
+
+    @ classmethod
+    def flush(cls):
+        '''Write out the pending dumps of all configs at once.'''
+        _writer.flush()
 
     @ classmethod
     def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
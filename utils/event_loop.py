@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import threading
+import time
+import concurrent.futures as ftrs
+
+from typing import Any, Awaitable, Callable, List, Optional, Set
+from asyncio import AbstractEventLoop
+from contextvars import ContextVar
+from functools import wraps
+
+from .config import BaseConfig
+
+
+__all__ = (
+    'CancelScope',
+    'current_scope',
+    'get_loop',
+    'submit',
+    'run',
+    'gather',
+    'shutdown',
+    'bind_updater',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+_lock = threading.Lock()
+_loop: Optional[AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_closing = False
+_scope: ContextVar[Optional['CancelScope']] = ContextVar('cancel_scope', default=None)
+
+
+class CancelScope:
+    '''A deadline and a cancel switch shared by all work done under it, on any thread.
+
+    While a scope is entered, `run()` and sends through the outbound scheduler wait at most until its deadline, and cancel what they waited for once it passes or `cancel()` is called. Coroutines started by `run()` see the scope too. A scope nested in another one never outlives it.
+    Threads do not inherit the scope, hand it over with `bind()`.
+    '''
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.parent = _scope.get()
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.__cancelled = False
+        self.__futures: Set[ftrs.Future] = set()
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __chain(self) -> List['CancelScope']:
+        chain, scope = list(), self
+        while scope is not None:
+            chain.append(scope)
+            scope = scope.parent
+        return chain
+
+    @ property
+    def cancelled(self) -> bool:
+        return any(scope.__cancelled for scope in self.__chain())
+
+    def remaining(self) -> Optional[float]:
+        '''Seconds left until the nearest deadline, None if there is none.'''
+        deadlines = [scope.deadline for scope in self.__chain() if scope.deadline is not None]
+        return max(min(deadlines) - time.monotonic(), 0.0) if deadlines else None
+
+    def cancel(self) -> None:
+        with self.__lock:
+            self.__cancelled = True
+            futures = list(self.__futures)
+        for future in futures:
+            future.cancel()
+
+    def wait(self, future: ftrs.Future, timeout: Optional[float] = None) -> Any:
+        '''Wait for `future` within `timeout` and the budget of the scope, cancelling it if either runs out.
+
+        Raises `concurrent.futures.TimeoutError` on timeout, and `concurrent.futures.CancelledError` if the scope is cancelled.
+        '''
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        chain = self.__chain()
+        for scope in chain:
+            with scope.__lock:
+                scope.__futures.add(future)
+        try:
+            if self.cancelled:
+                future.cancel()
+            return future.result(timeout)
+        except ftrs.TimeoutError:
+            future.cancel()
+            raise
+        finally:
+            for scope in chain:
+                with scope.__lock:
+                    scope.__futures.discard(future)
+
+    def bind(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        '''Wrap `func` to run under this scope, e.g. before submitting it to a thread pool.'''
+        @ wraps(func)
+        def wrapped(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapped
+
+    def __enter__(self) -> 'CancelScope':
+        tokens = self.__local.__dict__.setdefault('tokens', list())
+        tokens.append(_scope.set(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _scope.reset(self.__local.tokens.pop())
+
+
+def current_scope() -> Optional[CancelScope]:
+    return _scope.get()
+
+
+async def _scoped(coro: Awaitable[Any], scope: CancelScope) -> Any:
+    # The task runs in a copy of the loop thread's context, so the scope is set there
+    _scope.set(scope)
+    return await coro
+
+
+def _serve(loop: AbstractEventLoop, started: threading.Event):
+    asyncio.set_event_loop(loop)
+    loop.call_soon(started.set)
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def get_loop() -> AbstractEventLoop:
+    '''Return the process-wide event loop, starting its thread on first use.'''
+    global _loop, _thread
+    with _lock:
+        if _closing:
+            raise RuntimeError("The background event loop is shutting down.")
+        if _loop is None:
+            started = threading.Event()
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_serve, args=(_loop, started), name='event_loop', daemon=True)
+            _thread.start()
+            started.wait()
+        return _loop
+
+
+def submit(coro: Awaitable[Any]) -> ftrs.Future:
+    '''Schedule `coro` on the background loop without waiting for it.'''
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    '''Run `coro` on the background loop and block the calling thread until it finishes.
+
+    Raises `concurrent.futures.TimeoutError` after cancelling the coroutine if `timeout` or the budget of the current `CancelScope` is exceeded.
+    Must not be called from the loop thread itself, as that would deadlock.
+    '''
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("run() called from the event loop thread, await the coroutine instead.")
+    if (scope := _scope.get()) is not None:
+        return scope.wait(submit(_scoped(coro, scope)), timeout)
+    future = submit(coro)
+    try:
+        return future.result(timeout)
+    except ftrs.TimeoutError:
+        future.cancel()
+        raise
+
+
+async def gather(*aws: Awaitable[Any], return_exceptions: bool = False) -> Any:
+    '''Coroutine form of `asyncio.gather`, so a batch can be handed to `run()` from a thread without a loop.'''
+    return await asyncio.gather(*aws, return_exceptions=return_exceptions)
+
+
+async def _cancel_all():
+    from .sessions import close_sessions
+
+    current = asyncio.current_task()
+    tasks = [task for task in asyncio.all_tasks() if task is not current]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await close_sessions()
+
+
+def shutdown(timeout: Optional[float] = 10) -> None:
+    '''Cancel in-flight work, close the shared HTTP sessions and stop the background loop.'''
+    global _loop, _thread, _closing
+    with _lock:
+        if _loop is None or _closing:
+            return
+        _closing = True
+        loop, thread = _loop, _thread
+    try:
+        asyncio.run_coroutine_threadsafe(_cancel_all(), loop).result(timeout)
+    except Exception:
+        logger.exception("关闭事件循环时出现错误")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    with _lock:
+        _loop = _thread = None
+        _closing = False
+
+
+def bind_updater(updater) -> None:
+    '''Make `updater.stop()` cancel work pending on the background loop and write pending config before stopping the dispatcher.'''
+    original_stop = updater.stop
+
+    @ wraps(original_stop)
+    def stop(*args, **kwargs):
+        shutdown()
+        BaseConfig.flush()
+        return original_stop(*args, **kwargs)
+
+    updater.stop = stop
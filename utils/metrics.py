@@ -0,0 +1,276 @@
+import bisect
+import logging
+import threading
+import time
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .config import BaseConfig
+
+
+__all__ = (
+    'MetricsConfig',
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'counter',
+    'gauge',
+    'histogram',
+    'render',
+    'summary',
+    'serve',
+    'stage_seconds',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+
+class MetricsConfig(BaseConfig, config_file="push_config.json"):
+    metrics_listen: Optional[str] = str()   # e.g. "127.0.0.1", empty to disable the endpoint
+    metrics_port: Optional[int] = 9464
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f'# TYPE {self.name} {self.type}', f'# HELP {self.name} {_escape(self.help)}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.__values: Dict[Labels, float] = dict()
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.__values)
+        for labels, value in values.items():
+            yield f'{self.name}_total', labels, value
+
+
+class Gauge(_Metric):
+    '''A gauge that is either set directly or read from a function at collection time.'''
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.__values: Dict[Labels, float] = dict()
+        self.__functions: Dict[Labels, Callable[[], float]] = dict()
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self.__values[_labels(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels: Any) -> None:
+        with self._lock:
+            self.__functions[_labels(labels)] = function
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.__values)
+            functions = dict(self.__functions)
+        for labels, function in functions.items():
+            try:
+                values[labels] = function()
+            except Exception:
+                logger.exception(f"无法读取指标 {self.name}")
+        for labels, value in values.items():
+            yield self.name, labels, value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self.__values: Dict[Labels, List[Any]] = dict()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if (entry := self.__values.get(key)) is None:
+                entry = self.__values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @ contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        '''Observe the duration of the block, also when it raises.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[Labels, Tuple[List[int], float]]:
+        with self._lock:
+            return {labels: (list(counts), total) for labels, (counts, total) in self.__values.items()}
+
+    def samples(self):
+        for labels, (counts, total) in self.snapshot().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                yield f'{self.name}_bucket', labels + (('le', le),), cumulative
+            yield f'{self.name}_count', labels, cumulative
+            yield f'{self.name}_sum', labels, total
+
+    def quantile(self, q: float, counts: List[int]) -> float:
+        '''Estimate a quantile by linear interpolation within the bucket it falls in.'''
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            if count and cumulative + count >= rank:
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return lower
+
+
+_metrics: Dict[str, _Metric] = dict()
+_metrics_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, *args, **kwargs):
+    with _metrics_lock:
+        if (metric := _metrics.get(name)) is None:
+            metric = _metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise TypeError(f"Metric {name!r} is already a {metric.type}")
+        return metric
+
+
+def counter(name: str, help: str) -> Counter:
+    return _get_or_create(Counter, name, help)
+
+
+def gauge(name: str, help: str) -> Gauge:
+    return _get_or_create(Gauge, name, help)
+
+
+def histogram(name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, help, buckets)
+
+
+# Shared by every module taking part in a push, labelled with `stage` and `backend`
+stage_seconds = histogram('push_stage_seconds', 'Time spent in each stage of a push, by backend')
+
+
+def render() -> str:
+    '''All metrics in the OpenMetrics text format.'''
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    lines = [line for metric in metrics for line in metric.render()]
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def summary() -> Dict[str, Dict[str, Any]]:
+    '''A readable digest: count, mean, p50 and p99 for each histogram series, and the value of each counter and gauge series.'''
+    ret: Dict[str, Dict[str, Any]] = dict()
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    for metric in metrics:
+        series = ret.setdefault(metric.name, dict())
+        if isinstance(metric, Histogram):
+            for labels, (counts, total) in metric.snapshot().items():
+                count = sum(counts)
+                series[_format_labels(labels) or '{}'] = (
+                    f"count={count} mean={total / count if count else 0:.3f}s "
+                    f"p50={metric.quantile(0.5, counts):.3f}s p99={metric.quantile(0.99, counts):.3f}s"
+                )
+        else:
+            for _, labels, value in metric.samples():
+                series[_format_labels(labels) or '{}'] = value
+    return ret
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any):
+        logger.debug(f"metrics: {format % args}")
+
+
+def serve(listen: Optional[str] = None, port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    '''Serve `/metrics` from a daemon thread if `metrics_listen` is set.'''
+    listen = listen if listen is not None else MetricsConfig.metrics_listen
+    port = port if port is not None else MetricsConfig.metrics_port
+    if not listen:
+        return None
+    server = ThreadingHTTPServer((listen, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"指标接口已启动: http://{listen}:{port}/metrics")
+    return server
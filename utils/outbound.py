@@ -0,0 +1,283 @@
+import logging
+import threading
+import time
+import concurrent.futures as ftrs
+
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+
+from .config import BaseConfig, User, user_format
+from .event_loop import current_scope
+from .metrics import histogram
+from .stats import register_stats
+
+
+__all__ = (
+    'OutboundConfig',
+    'Scheduler',
+    'ScheduledBot',
+    'scheduler',
+    'scheduled',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+_request_seconds = histogram('telegram_request_seconds', 'Duration of outbound Bot API calls, by method')
+_queue_seconds = histogram('telegram_queue_seconds', 'Time outbound Bot API calls wait for their turn')
+
+
+class OutboundConfig(BaseConfig, config_file="push_config.json"):
+    send_rate_global: Optional[float] = 30.0        # messages per second, all chats together
+    send_rate_group: Optional[float] = 20.0         # messages per minute, per group or channel
+    send_rate_private: Optional[float] = 60.0       # messages per minute, per private chat
+    send_workers: Optional[int] = 8
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float, weight: float = 1) -> float:
+        '''Seconds to wait until `weight` tokens are available.'''
+        self._refill(now)
+        weight = min(weight, self.capacity)
+        return 0 if self.tokens >= weight else (weight - self.tokens) / self.rate
+
+    def take(self, now: float, weight: float = 1):
+        self._refill(now)
+        self.tokens -= min(weight, self.capacity)
+
+
+class _Job:
+    __slots__ = ('func', 'args', 'kwargs', 'weight', 'future', 'submitted')
+
+    def __init__(self, func: Callable[..., Any], args: tuple, kwargs: dict, weight: float):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.weight = weight
+        self.future = ftrs.Future()
+        self.submitted = time.monotonic()
+
+
+class Scheduler:
+    '''Paces outbound Bot API calls with a global token bucket and one bucket per chat.
+
+    Calls to the same chat run one at a time in submission order. A `RetryAfter` from Telegram pauses the chat for the given time and the call is retried at the head of its queue, unless its caller has given up on it by then.
+
+    Chats are keyed as given, see `chat_key` for sharing the buckets of `'@name'` and the numeric id of one chat.
+    '''
+
+    def __init__(self, global_rate: float, group_rate: float, private_rate: float, workers: int):
+        self.__group_rate = group_rate / 60
+        self.__private_rate = private_rate / 60
+        self.__global = _TokenBucket(global_rate, global_rate)
+        self.__buckets: Dict[User, _TokenBucket] = dict()
+        self.__queues: Dict[User, Deque[_Job]] = dict()
+        self.__busy = set()
+        self.__paused_until: Dict[User, float] = dict()
+        self.__chat_ids: Dict[str, int] = dict()
+        self.__cond = threading.Condition()
+        self.__pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbound')
+        self.__thread: Optional[threading.Thread] = None
+
+        self.__sent = 0
+        self.__retried = 0
+        self.__failed = 0
+        self.__wait_total = 0.0
+        self.__wait_max = 0.0
+
+    def __bucket(self, chat: User) -> _TokenBucket:
+        try:
+            return self.__buckets[chat]
+        except KeyError:
+            # Positive integer ids are private chats, everything else is a group or a channel
+            rate = self.__private_rate if isinstance(chat, int) and chat > 0 else self.__group_rate
+            bucket = self.__buckets[chat] = _TokenBucket(rate, max(1.0, rate * 10))
+            return bucket
+
+    def chat_key(self, chat: User, bot: Bot) -> User:
+        '''The key to queue calls to `chat` under, the numeric id for `'@name'`, looked up through `bot` once.'''
+        if not isinstance(chat, str):
+            return chat
+        if chat.lstrip('-').isdigit():
+            return int(chat)
+        name = user_format(chat).lower()
+        try:
+            return self.__chat_ids[name]
+        except KeyError:
+            pass
+        try:
+            chat_id = self.__chat_ids[name] = bot.get_chat(name).id
+        except TelegramError as exc:
+            # Queued by name until the lookup succeeds
+            logger.warning(f"无法获取 {name} 的 id: {exc}")
+            return chat
+        return chat_id
+
+    def submit(self, chat: User, func: Callable[..., Any], *args, _weight: float = 1, **kwargs) -> ftrs.Future:
+        job = _Job(func, args, kwargs, _weight)
+        with self.__cond:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name='outbound_scheduler', daemon=True)
+                self.__thread.start()
+            self.__queues.setdefault(chat, deque()).append(job)
+            self.__cond.notify()
+        return job.future
+
+    def call(self, chat: User, func: Callable[..., Any], *args, **kwargs) -> Any:
+        '''Queue a call to `chat` and block until it has been sent.
+
+        Under a `CancelScope`, gives up once the scope runs out, withdrawing the call if it has not been sent yet or is waiting to be retried.
+        '''
+        future = self.submit(chat, func, *args, **kwargs)
+        if (scope := current_scope()) is not None:
+            return scope.wait(future)
+        return future.result()
+
+    def __run(self):
+        with self.__cond:
+            while True:
+                wake = self.__dispatch_ready()
+                self.__cond.wait(wake)
+
+    def __dispatch_ready(self) -> Optional[float]:
+        now = time.monotonic()
+        wake = None
+        for chat, queue in list(self.__queues.items()):
+            if not queue:
+                if chat not in self.__busy:
+                    del self.__queues[chat]
+                continue
+            if chat in self.__busy:
+                continue
+            # Calls withdrawn while waiting do not take up the rate limit
+            while queue and queue[0].future.cancelled():
+                queue.popleft()
+            if not queue:
+                continue
+            job = queue[0]
+            delay = max(
+                self.__paused_until.get(chat, now) - now,
+                self.__bucket(chat).delay(now, job.weight),
+                self.__global.delay(now, job.weight),
+            )
+            if delay > 0:
+                wake = delay if wake is None else min(wake, delay)
+                continue
+            queue.popleft()
+            self.__bucket(chat).take(now, job.weight)
+            self.__global.take(now, job.weight)
+            self.__busy.add(chat)
+            waited = now - job.submitted
+            self.__wait_total += waited
+            self.__wait_max = max(self.__wait_max, waited)
+            _queue_seconds.observe(waited)
+            self.__pool.submit(self.__execute, chat, job)
+        return wake
+
+    def __execute(self, chat: User, job: _Job):
+        retry = None
+        # The future stays pending until the call has an outcome, so a caller giving up in the meantime can still cancel it
+        if not job.future.cancelled():
+            start = time.perf_counter()
+            try:
+                result = job.func(*job.args, **job.kwargs)
+            except RetryAfter as exc:
+                retry = exc.retry_after
+            except BaseException as exc:
+                self.__failed += 1
+                if job.future.set_running_or_notify_cancel():
+                    job.future.set_exception(exc)
+            else:
+                self.__sent += 1
+                if job.future.set_running_or_notify_cancel():
+                    job.future.set_result(result)
+            _request_seconds.observe(time.perf_counter() - start, method=getattr(job.func, '__name__', 'call'))
+
+        with self.__cond:
+            if retry is not None:
+                self.__retried += 1
+                self.__paused_until[chat] = time.monotonic() + retry
+                if job.future.done():
+                    logger.warning(f"发送至 {chat} 触发限流, 调用方已放弃, 不再重试")
+                else:
+                    logger.warning(f"发送至 {chat} 触发限流, {retry} 秒后重试")
+                    self.__queues.setdefault(chat, deque()).appendleft(job)
+            self.__busy.discard(chat)
+            self.__cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.__cond:
+            depths = [len(queue) for queue in self.__queues.values()]
+            return {
+                'queue_depth': sum(depths),
+                'max_chat_queue_depth': max(depths, default=0),
+                'in_flight': len(self.__busy),
+                'sent': self.__sent,
+                'failed': self.__failed,
+                'retry_after': self.__retried,
+                'wait_avg': self.__wait_total / (self.__sent + self.__failed) if self.__sent + self.__failed else 0.0,
+                'wait_max': self.__wait_max,
+            }
+
+
+# Methods whose first argument or `chat_id` keyword names the chat being written to
+_CHAT_METHODS = (
+    'send_', 'edit_message_', 'forward_message', 'copy_message', 'delete_message',
+)
+
+
+class ScheduledBot:
+    '''Wraps a `Bot` so that every call writing to a chat goes through the outbound scheduler.'''
+
+    def __init__(self, bot: Bot, scheduler: Scheduler):
+        self.__bot = bot
+        self.__scheduler = scheduler
+
+    @ property
+    def bot(self) -> Bot:
+        return self.__bot
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.__bot, name)
+        if not (callable(attr) and name.startswith(_CHAT_METHODS)):
+            return attr
+
+        def scheduled_call(*args, **kwargs):
+            chat = kwargs['chat_id'] if 'chat_id' in kwargs else args[0]
+            media = kwargs.get('media', args[1] if name == 'send_media_group' and len(args) > 1 else None)
+            weight = len(media) if name == 'send_media_group' and media else 1
+            return self.__scheduler.call(self.__scheduler.chat_key(chat, self.__bot), attr, *args, _weight=weight, **kwargs)
+
+        return scheduled_call
+
+
+scheduler = Scheduler(
+    OutboundConfig.send_rate_global,
+    OutboundConfig.send_rate_group,
+    OutboundConfig.send_rate_private,
+    OutboundConfig.send_workers,
+)
+register_stats('outbound', scheduler.stats)
+
+
+def scheduled(bot: Bot) -> ScheduledBot:
+    if isinstance(bot, ScheduledBot):
+        return bot
+    return ScheduledBot(bot, scheduler)
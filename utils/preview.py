@@ -9,6 +9,8 @@ from io import BytesIO
 from functools import cached_property, partial, wraps
 from bs4 import BeautifulSoup, Tag
 
+from utils import event_loop, sessions
+
 # ! This part is unfinished for now
 
 headers = {
@@ -25,10 +27,9 @@ def _modify(image_url: str) -> str:
     return image_url.replace(r'=small', r'=large').replace(r'=medium', r'=large')
 
 async def _get_resp(url: str, method: str, extra_headers = dict(), args = list(), kwargs = dict()) -> Tuple[int, Any]:
-    extra_headers.update(headers)
-    async with aiohttp.ClientSession(trust_env=True, headers=extra_headers) as session:
-        async with session.get(url) as resp:
-            return resp.status, await getattr(resp, method)(*args, **kwargs)
+    session = sessions.session('preview', trust_env=True, headers=headers)
+    async with session.get(url, headers=extra_headers) as resp:
+        return resp.status, await getattr(resp, method)(*args, **kwargs)
 
 async def get_html(url: str, extra_headers = dict()) -> Tuple[int, str]:
     return await _get_resp(url, 'text', extra_headers)
@@ -159,9 +160,7 @@ class HTMLData:
     def _first_image(self) -> Tuple[str, Optional[Image.Image]]:
         for tag in self.__image_tags:
             u = tag['src']
-            loop = asyncio.new_event_loop()
-            image = loop.run_until_complete(get_image(u))
-            loop.close()
+            image = event_loop.run(get_image(u))
 
             width, height = map(int, (tag.get('width', '0'), tag.get('height', '0')))
             if not (width and height) and (image is not None):
@@ -190,10 +189,8 @@ class HTMLData:
 
         first = self._first_image
         rest = list(self.__image_tags)
-        loop = asyncio.new_event_loop()
         print(rest) # DEBUG
-        images = loop.run_until_complete(asyncio.gather(*map(get_image, rest)))
-        loop.close()
+        images = event_loop.run(event_loop.gather(*map(get_image, rest)))
         return_tag, return_image = max(chain(zip(rest, images), first), key=lambda t: get_size(*t))
         return return_tag['src'], return_image
 
@@ -1,19 +1,41 @@
-import re
 import logging
+import threading
 
-from typing import Dict, Set, List, Optional
+from functools import cached_property
+from typing import Dict, Set, List, Optional, Any, Tuple, Sequence, Callable
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
 from telegram import Bot
-from telegram.ext.dispatcher import run_async
 
 import utils
 import utils.regexes as regex
-from utils import Config
-from .bilifeed import send_bili_feed
-from .pixiv_parser import PixivParser
+from utils import Config, BaseConfig
+from utils.bot import get_bot
+from utils.event_loop import CancelScope
+from utils.metrics import counter, gauge, stage_seconds
+from utils.outbound import scheduled
+from .push_queue import PushQueue
+from .router import Backend, Route, router
 
 
 logger = logging.getLogger("push_helper")
 
+_deliveries = counter("push_deliveries", "Deliveries of a message to a target, by result")
+
+
+class PushConfig(BaseConfig, config_file="push_config.json"):
+    push_parallelism: Optional[int] = 4         # messages resolved at the same time
+    push_delivery_workers: Optional[int] = 8    # targets delivered to at the same time
+    push_timeout: Optional[float] = 300.0       # seconds to resolve a message, and to deliver it to each target
+
+    @classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+_resolve_pool = ThreadPoolExecutor(max_workers=PushConfig.push_parallelism, thread_name_prefix="resolve")
+# Sending to different targets only waits on Telegram, so it is done concurrently
+_delivery_pool = ThreadPoolExecutor(max_workers=PushConfig.push_delivery_workers, thread_name_prefix="deliver")
+
 
 class Message():
     def __init__(self, url: str):
@@ -39,9 +61,46 @@ class Message():
     def __repr__(self) -> str:
         return f"<Message:\n{ self.__str__() }\n>"
 
-    def push(self, targets_additional: Optional[List[utils.User]] = None, tags_additional: Optional[List[str]] = None):
-        bot = Bot(token=Config.token)
-        sep = "\n\n"
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "tag_indices": sorted(self.tag_indices),
+            "target_indices": sorted(self.target_indices),
+            "customized_tags": self.customized_tags,
+            "customized_targets": self.customized_targets,
+        }
+
+    @classmethod
+    def from_json(cls, json_obj: Dict[str, Any]) -> "Message":
+        message = cls(json_obj["url"])
+        message.tag_indices = set(json_obj["tag_indices"])
+        message.target_indices = set(json_obj["target_indices"])
+        message.customized_tags = list(json_obj["customized_tags"])
+        message.customized_targets = list(json_obj["customized_targets"])
+        return message
+
+    @cached_property
+    def route(self) -> Route:
+        return router.route(self.url)
+
+    def resolve(self) -> Tuple[Backend, Any]:
+        '''Fetch everything needed to send this message once, independent of the targets.'''
+        backend = self.route.backend
+        with stage_seconds.time(stage="resolve", backend=backend.name):
+            return backend, backend.resolve(self.url)
+
+    def deliver(self, resolved: Tuple[Backend, Any], tags: List[str], bot: Bot, target: utils.User):
+        backend, content = resolved
+        sep = "\n\n" if tags else ""
+        with stage_seconds.time(stage="deliver", backend=backend.name):
+            backend.deliver(
+                content,
+                sep + "  ".join([backend.tag_prefix + tag for tag in tags]),
+                bot,
+                target
+            )
+
+    def plan(self, targets_additional: Optional[List[utils.User]] = None, tags_additional: Optional[List[str]] = None) -> Tuple[List[str], List[utils.User]]:
         self_tags = self.get_tags()
         if tags_additional:
             self_tags += tags_additional
@@ -51,31 +110,82 @@ class Message():
             self_targets = self.get_targets()
         if not self_targets:
             self_targets = [Config.targets[0]]
-        if not self_tags:
-            sep = ""
-
-        for target in self_targets:
-            if not re.search(regex.bili, self.url) and not re.search(regex.pixiv, self.url):
-                bot.send_message(
-                    target,
-                    self.url + sep +
-                    "  ".join(map(lambda tag: "#" + tag, self_tags))
-                )
-            elif re.search(regex.pixiv, self.url):
-                PixivParser.send(
-                    self.url,
-                    sep + "  ".join(["#" + tag for tag in self_tags]),
-                    bot,
-                    target
-                )
-            else:
-                send_bili_feed(
-                    self.url,
-                    sep + "  ".join([r"\#" + tag for tag in self_tags]),
-                    bot,
-                    target
-                )
-            logger.info("将 {} 推送至 {}".format(self.url, target))
-
-
-waiting_to_push: Dict[int, Message] = {}
+        return self_tags, self_targets
+
+    def push(self, targets_additional: Optional[List[utils.User]] = None, tags_additional: Optional[List[str]] = None):
+        push_all([self], targets_additional, tags_additional)
+
+
+def push_all(
+        messages: Sequence[Message],
+        targets_additional: Optional[List[utils.User]] = None,
+        tags_additional: Optional[List[str]] = None,
+        on_pushed: Optional[Callable[[int], Any]] = None):
+    '''Push `messages` in order.
+
+    Up to `push_parallelism` messages are resolved at once, ahead of delivery. Each target receives its messages one after another in the given order, while different targets are served concurrently.
+    Resolving a message and delivering it to each target are each given `push_timeout` seconds, after which downloads still running and sends still queued are cancelled.
+    `on_pushed(index)` is called once a message has been delivered to all of its targets, successfully or not.
+    '''
+    def resolve(message: Message) -> Tuple[Backend, Any]:
+        with CancelScope(PushConfig.push_timeout):
+            resolved = message.resolve()
+        if resolved[1] is None:
+            logger.warning(f"无法解析 {message.url}, 放弃推送")
+        return resolved
+
+    def deliver_in_order(target: utils.User, indices: List[int]):
+        for index in indices:
+            message = messages[index]
+            try:
+                resolved = resolving[index].result()
+                if resolved[1] is not None:
+                    with CancelScope(PushConfig.push_timeout):
+                        message.deliver(resolved, plans[index][0], bot, target)
+                    logger.info("将 {} 推送至 {}".format(message.url, target))
+                    _deliveries.inc(target=target, result="success")
+                else:
+                    _deliveries.inc(target=target, result="unresolved")
+            except TimeoutError:
+                _deliveries.inc(target=target, result="timeout")
+                logger.warning(f"推送 {message.url} 至 {target} 超时, 已放弃")
+            except Exception:
+                _deliveries.inc(target=target, result="failure")
+                logger.exception(f"推送 {message.url} 至 {target} 失败")
+            finally:
+                with lock:
+                    remaining[index] -= 1
+                    done = not remaining[index]
+                if done and on_pushed is not None:
+                    on_pushed(index)
+
+    bot = scheduled(get_bot())
+    lock = threading.Lock()
+    plans = [message.plan(targets_additional, tags_additional) for message in messages]
+    remaining = [len(targets) for _, targets in plans]
+    resolving = [_resolve_pool.submit(resolve, message) for message in messages]
+
+    queues: Dict[utils.User, List[int]] = dict()
+    for index, (_, targets) in enumerate(plans):
+        for target in targets:
+            queues.setdefault(target, list()).append(index)
+    wait([
+        _delivery_pool.submit(deliver_in_order, target, indices)
+        for target, indices in queues.items()
+    ])
+
+
+def _send_link(url: str, classification: str, bot: Bot, target: utils.User):
+    bot.send_message(target, url + classification)
+
+
+router.add_backend(Backend("link", lambda url: url, _send_link), default=True)
+# Parser backends pull in heavy dependencies, so they are only imported once a url needs them
+router.add_backend_module("pixiv", "utils.push.pixiv_parser")
+router.add_backend_module("bili", "utils.push.bilifeed")
+router.add_route("pixiv", ("pixiv.net",), regex.pixiv)
+router.add_route("bili", ("bilibili.com", "b23.tv", "acg.tv"), regex.bili, fallback=True)
+
+waiting_to_push: PushQueue = PushQueue(
+    PushQueue.Config.push_queue_path, Message.to_json, Message.from_json)
+gauge("push_waiting", "Messages waiting to be pushed").set_function(lambda: len(waiting_to_push))
@@ -3,29 +3,29 @@
 
 
 import asyncio
-import json
 import logging
-import os
 import re
-import sys
+import threading
+from contextlib import ExitStack
 from functools import lru_cache
+from typing import List, Optional
 from io import BytesIO
-from uuid import uuid4
-import aiohttp
-from PIL import Image
 from telegram import (
     Bot,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     InputMediaPhoto,
-    InputTextMessageContent,
     ParseMode,
 )
 from telegram.error import BadRequest, TimedOut
-from telegram.ext.dispatcher import run_async
-from telegram.utils.helpers import escape_markdown
 
+from utils import event_loop, sessions
+from utils.metrics import stage_seconds
+from utils.relay import MediaTooLarge, Spool, spool_response
+from utils.transcode import transcode
 from .feedparser import feedparser, headers
+from .file_cache import file_ids, fingerprint
+from .router import Backend, router
 
 
 logging.basicConfig(
@@ -60,132 +60,201 @@ def captions(f):
 
 
 async def get_media(f, url, size=1280, compression=True):
-    def compress(inpil):
-        pil = Image.open(inpil)
-        pil.thumbnail((size, size), Image.LANCZOS)
-        pil.save(outpil := BytesIO(), "PNG", optimize=True)
-        return outpil
-
-    async with aiohttp.ClientSession(headers=headers) as session:
+    session = sessions.session("bilibili", headers=headers)
+    with stage_seconds.time(stage="download", backend="bili"):
         async with session.get(url, headers={"Referer": f.url}) as resp:
-            media = BytesIO(await resp.read())
+            media = await spool_response(resp)
             mediatype = resp.headers["Content-Type"]
     if compression:
         if mediatype in ["image/jpeg", "image/png"]:
-            logger.info(f"压缩: {url} {mediatype}")
-            media = compress(media)
-    media.seek(0)
+            media = Spool.from_bytes(await transcode(media.getvalue(), size, name=url, backend="bili"))
     return media
 # <
 
 
-# > 这个函数是 telegram-bili-feed-helper/main.py 中 parse 函数的改写。
-def send_bili_feed(url: str, classification: str, bot: Bot, target):
-    async def callback(f, caption):
-        if f.mediathumb:
-            mediathumb = await get_media(f, f.mediathumb, size=320)
-        if f.mediaraws:
-            tasks = [get_media(f, img) for img in f.mediaurls]
-            media = await asyncio.gather(*tasks)
-            logger.info(f"上传中: {f.url}")
-        else:
-            if f.mediatype == "image":
-                media = [i if ".gif" in i else i +
-                         "@1280w.jpg" for i in f.mediaurls]
-            else:
-                media = f.mediaurls
-        if f.mediatype == "video":
-            bot.send_video(
+# > 以下函数是 telegram-bili-feed-helper/main.py 中 parse 函数的改写, 拆分为只执行一次的解析和对每个目标执行的发送。
+class BiliFeed:
+    def __init__(self, f):
+        self.f = f
+        self.caption = captions(f)
+        self.mediathumb: Optional[bytes] = None
+        self.__mediaraws: Optional[List[Spool]] = None
+        self.__too_large: Optional[MediaTooLarge] = None
+        self.__lock = threading.Lock()
+
+    async def fetch_mediaraws(self):
+        try:
+            self.__mediaraws = await asyncio.gather(*[get_media(self.f, img) for img in self.f.mediaurls])
+        except MediaTooLarge as err:
+            self.__too_large = err
+            raise
+
+    def mediaraws(self) -> List[Spool]:
+        with self.__lock:
+            if self.__too_large is not None:
+                raise self.__too_large
+            if self.__mediaraws is None:
+                logger.info(f"下载中: {self.f.url}")
+                event_loop.run(self.fetch_mediaraws())
+        return self.__mediaraws
+
+
+async def _resolve(url: str) -> Optional[BiliFeed]:
+    with stage_seconds.time(stage="api", backend="bili"):
+        f = await feedparser(url, video=True)  # Finall: 启用视频类内容解析
+    if not f:
+        logger.warning(f"解析错误!")
+        return None
+    feed = BiliFeed(f)
+    if f.mediathumb:
+        feed.mediathumb = (await get_media(f, f.mediathumb, size=320)).getvalue()
+    if f.mediaurls and f.mediaraws:
+        try:
+            await feed.fetch_mediaraws()
+        except MediaTooLarge as err:
+            logger.warning(err)
+    return feed
+
+
+def resolve_bili_feed(url: str) -> Optional[BiliFeed]:
+    return event_loop.run(_resolve(url))
+
+
+def _send_media(f, caption: str, mediathumb: Optional[BytesIO], media: list, bot: Bot, target) -> list:
+    if f.mediatype == "video":
+        return [bot.send_video(
+            target,
+            media[0],
+            caption=caption,
+            parse_mode=ParseMode.MARKDOWN_V2,
+            # quote=False,
+            reply_markup=origin_link(f.url),
+            supports_streaming=True,
+            thumb=mediathumb,
+            timeout=120,
+        )]
+    elif f.mediatype == "audio":
+        return [bot.send_audio(
+            target,
+            media[0],
+            caption=caption,
+            duration=f.mediaduration,
+            parse_mode=ParseMode.MARKDOWN_V2,
+            performer=f.user,
+            # quote=False,
+            reply_markup=origin_link(f.url),
+            thumb=mediathumb,
+            timeout=120,
+            title=f.mediatitle,
+        )]
+    elif len(f.mediaurls) == 1:
+        if ".gif" in f.mediaurls[0]:
+            return [bot.send_animation(
                 target,
                 media[0],
-                caption=(captions(f) + classification),
+                caption=caption,
                 parse_mode=ParseMode.MARKDOWN_V2,
                 # quote=False,
                 reply_markup=origin_link(f.url),
-                supports_streaming=True,
-                thumb=mediathumb,
-                timeout=120,
-            )
-        elif f.mediatype == "audio":
-            bot.send_audio(
+                timeout=60,
+            )]
+        else:
+            return [bot.send_photo(
                 target,
                 media[0],
-                caption=(captions(f) + classification),
-                duration=f.mediaduration,
+                caption=caption,
                 parse_mode=ParseMode.MARKDOWN_V2,
-                performer=f.user,
                 # quote=False,
                 reply_markup=origin_link(f.url),
-                thumb=mediathumb,
-                timeout=120,
-                title=f.mediatitle,
+                timeout=60,
+            )]
+    else:
+        media = [
+            InputMediaPhoto(
+                img, caption=caption, parse_mode=ParseMode.MARKDOWN_V2
             )
-        elif len(f.mediaurls) == 1:
-            if ".gif" in f.mediaurls[0]:
-                bot.send_animation(
-                    target,
-                    media[0],
-                    caption=(captions(f) + classification),
-                    parse_mode=ParseMode.MARKDOWN_V2,
-                    # quote=False,
-                    reply_markup=origin_link(f.url),
-                    timeout=60,
-                )
+            for img in media
+        ]
+        messages = bot.send_media_group(target, media, timeout=120)
+        bot.send_message(
+            target,
+            caption,
+            disable_web_page_preview=True,
+            parse_mode=ParseMode.MARKDOWN_V2,
+            # quote=False,
+            reply_markup=origin_link(f.url),
+        )
+        return messages
+
+
+def _send(feed: BiliFeed, classification: str, bot: Bot, target, mediaraws: bool):
+    def media(cached: list, stack: ExitStack) -> list:
+        ret = list()
+        for file_id, source, content in zip(cached, sources, contents):
+            if file_id:
+                ret.append(file_id[0])
+            elif content is not None:
+                ret.append(stack.enter_context(content.open()))
             else:
-                bot.send_photo(
-                    target,
-                    media[0],
-                    caption=(captions(f) + classification),
-                    parse_mode=ParseMode.MARKDOWN_V2,
-                    # quote=False,
-                    reply_markup=origin_link(f.url),
-                    timeout=60,
-                )
+                ret.append(source)
+        return ret
+
+    f = feed.f
+    caption = feed.caption + classification
+    if mediaraws:
+        sources = f.mediaurls
+        contents = feed.mediaraws()
+        logger.info(f"上传中: {f.url}")
+    else:
+        if f.mediatype == "image":
+            sources = [i if ".gif" in i else i +
+                       "@1280w.jpg" for i in f.mediaurls]
         else:
-            media = [
-                InputMediaPhoto(
-                    img, caption=(captions(f) + classification), parse_mode=ParseMode.MARKDOWN_V2
-                )
-                for img in media
-            ]
-            bot.send_media_group(target, media, timeout=120)
-            bot.send_message(
-                target,
-                (captions(f) + classification),
-                disable_web_page_preview=True,
-                parse_mode=ParseMode.MARKDOWN_V2,
-                # quote=False,
-                reply_markup=origin_link(f.url),
-            )
+            sources = f.mediaurls
+        contents = [None] * len(sources)
+    fps = [
+        fingerprint(source, digest=content.digest if content is not None else None)
+        for source, content in zip(sources, contents)
+    ]
 
-    async def parse_queue(url):
-        f = await feedparser(url, video=True)  # Finall: 启用视频类内容解析
-        if not f:
-            logger.warning(f"解析错误!")
-            return
-        reply_markup = InlineKeyboardMarkup(
-            [[InlineKeyboardButton(text="原链接", url=f.url)]]
-        )
-        if f.mediaurls:
+    def send(cached: list) -> list:
+        with ExitStack() as stack:
+            mediathumb = BytesIO(feed.mediathumb) if feed.mediathumb else None
+            return _send_media(f, caption, mediathumb, media(cached, stack), bot, target)
+
+    file_ids.deliver(fps, send, f.url)
+
+
+def deliver_bili_feed(feed: BiliFeed, classification: str, bot: Bot, target):
+    f = feed.f
+    if f.mediaurls:
+        try:
             try:
-                await callback(f, captions(f))
+                _send(feed, classification, bot, target, f.mediaraws)
             except (TimedOut, BadRequest) as err:
+                if f.mediaraws:
+                    raise
                 logger.exception(err)
                 logger.info(f"{err} -> 下载中: {f.url}")
-                f.mediaraws = True
-                await callback(f, captions(f))
-        else:
-            bot.send_message(
-                target,
-                (captions(f) + classification),
-                disable_web_page_preview=True,
-                parse_mode=ParseMode.MARKDOWN_V2,
-                # quote=False,
-                reply_markup=reply_markup,
-            )
+                _send(feed, classification, bot, target, True)
+            return
+        except MediaTooLarge as err:
+            # Telegram would refuse the upload anyway, the origin link button still leads to the media
+            logger.warning(f"{err}, 仅发送文字: {f.url}")
+    bot.send_message(
+        target,
+        (feed.caption + classification),
+        disable_web_page_preview=True,
+        parse_mode=ParseMode.MARKDOWN_V2,
+        # quote=False,
+        reply_markup=origin_link(f.url),
+    )
+
 
-    loop = asyncio.new_event_loop()
-    tasks = [parse_queue(url)]
-    loop.run_until_complete(asyncio.gather(*tasks, loop=loop))
-    loop.close()
+def send_bili_feed(url: str, classification: str, bot: Bot, target):
+    if (feed := resolve_bili_feed(url)) is not None:
+        deliver_bili_feed(feed, classification, bot, target)
 # <
+
+
+router.add_backend(Backend("bili", resolve_bili_feed, deliver_bili_feed, tag_prefix=r"\#"))
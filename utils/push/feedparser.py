@@ -4,9 +4,13 @@
 import json
 import logging
 import re
-from functools import cached_property, lru_cache
+from functools import cached_property, lru_cache, wraps
+from typing import Any, Dict, Optional, Tuple
 
-import aiohttp
+from utils import BaseConfig, register_stats, sessions
+from utils.ttl_cache import MISS, TTLCache
+from .router import router
+from .short_link import short_links
 
 logger = logging.getLogger("Bili_Feed_Parser")
 
@@ -297,6 +301,84 @@ class video(feed):
         return f"https://www.bilibili.com/video/av{self.aid}"
 
 
+class FeedCacheConfig(BaseConfig, config_file="push_config.json"):
+    bili_cache_ttl: Optional[Dict[str, float]] = {
+        "dynamic": 600, "clip": 1800, "audio": 3600, "live": 60, "video": 1800,
+    }
+    bili_cache_negative_ttl: Optional[float] = 60
+    bili_cache_size: Optional[int] = 16 * 1024 * 1024  # approximate bytes of API responses
+
+    @classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+_feed_cache = TTLCache(FeedCacheConfig.bili_cache_size)
+register_stats("bili_cache", _feed_cache.stats)
+
+dynamic_regex = re.compile(r"[th]\.bilibili\.com[\/\w]*\/(\d+)")
+clip_regex = re.compile(r"vc\.bilibili\.com[\D]*(\d+)")
+audio_regex = re.compile(r"bilibili\.com\/audio\/au(\d+)")
+live_regex = re.compile(r"live\.bilibili\.com[\/\w]*\/(\d+)")
+video_regex = re.compile(
+    r"(?i)(?:bilibili\.com/(?:video|bangumi/play)|b23\.tv|acg\.tv)/(?:(?P<bvid>bv\w+)|av(?P<aid>\d+)|ep(?P<epid>\d+)|ss(?P<ssid>\d+))"
+)
+
+
+def _weight(f):
+    """Approximate memory held by a parsed feed, dominated by the raw API responses."""
+    weight = 256
+    for value in vars(f).values():
+        if isinstance(value, str):
+            weight += len(value)
+        elif isinstance(value, (dict, list)):
+            weight += len(json.dumps(value, ensure_ascii=False))
+    return weight
+
+
+def cached(kind, regex, key):
+    """Cache a parser by the canonical id `key(match)` of the object the url points to.
+
+    Results are shared between callers and must be treated as read-only. `None`
+    results are kept for `bili_cache_negative_ttl` so that dead links are not
+    looked up again on every push, exceptions are never cached.
+    """
+
+    def decorator(parser):
+        @wraps(parser)
+        async def wrapper(s, url):
+            if not (match := regex.search(url)):
+                return await parser(s, url)
+            cache_key = (kind, *key(match))
+            if (f := _feed_cache.get(cache_key)) is not MISS:
+                return f
+            f = await parser(s, url)
+            if f is None:
+                _feed_cache.put(cache_key, None, FeedCacheConfig.bili_cache_negative_ttl)
+            else:
+                ttl = FeedCacheConfig.bili_cache_ttl.get(kind, 0)
+                _feed_cache.put(cache_key, f, ttl, _weight(f))
+            return f
+
+        return wrapper
+
+    return decorator
+
+
+def _dynamic_key(match):
+    if "type=2" in match.group(0) or "h.bilibili.com" in match.group(0):
+        return "rid", match.group(1)
+    return "dynamic_id", match.group(1)
+
+
+def _video_key(match):
+    if bvid := match.group("bvid"):
+        return "bvid", f"BV{bvid[2:]}"
+    for name in ("aid", "epid", "ssid"):
+        if value := match.group(name):
+            return name, value
+
+
 async def reply_parser(s, oid, reply_type):
     async with s.get(
         "https://api.bilibili.com/x/v2/reply", params={"oid": oid, "type": reply_type},
@@ -304,8 +386,9 @@ async def reply_parser(s, oid, reply_type):
         return await resp.json(content_type="application/json")
 
 
+@cached("dynamic", dynamic_regex, _dynamic_key)
 async def dynamic_parser(s, url):
-    if not (match := re.search(r"[th]\.bilibili\.com[\/\w]*\/(\d+)", url)):
+    if not (match := dynamic_regex.search(url)):
         logger.warning(f"动态解析错误: {url}")
         return
     f = dynamic(url)
@@ -417,8 +500,9 @@ async def dynamic_parser(s, url):
     return f
 
 
+@cached("clip", clip_regex, lambda match: match.groups())
 async def clip_parser(s, url):
-    if not (match := re.search(r"vc\.bilibili\.com[\D]*(\d+)", url)):
+    if not (match := clip_regex.search(url)):
         logger.warning(f"短视频解析错误: {url}")
         return
     f = clip(url)
@@ -444,8 +528,9 @@ async def clip_parser(s, url):
     return f
 
 
+@cached("audio", audio_regex, lambda match: match.groups())
 async def audio_parser(s, url):
-    if not (match := re.search(r"bilibili\.com\/audio\/au(\d+)", url)):
+    if not (match := audio_regex.search(url)):
         logger.warning(f"音频解析错误: {url}")
         return
     f = audio(url)
@@ -484,8 +569,9 @@ async def audio_parser(s, url):
     return f
 
 
+@cached("live", live_regex, lambda match: match.groups())
 async def live_parser(s, url):
-    if not (match := re.search(r"live\.bilibili\.com[\/\w]*\/(\d+)", url)):
+    if not (match := live_regex.search(url)):
         logger.warning(f"直播解析错误: {url}")
         return
     f = live(url)
@@ -509,13 +595,9 @@ async def live_parser(s, url):
     return f
 
 
+@cached("video", video_regex, _video_key)
 async def video_parser(s, url):
-    if not (
-        match := re.search(
-            r"(?i)(?:bilibili\.com/(?:video|bangumi/play)|b23\.tv|acg\.tv)/(?:(?P<bvid>bv\w+)|av(?P<aid>\d+)|ep(?P<epid>\d+)|ss(?P<ssid>\d+))",
-            url,
-        )
-    ):
+    if not (match := video_regex.search(url)):
         logger.warning(f"视频解析错误: {url}")
         return
     f = video(url)
@@ -575,33 +657,39 @@ async def video_parser(s, url):
     return f
 
 
+parsers = {
+    "dynamic": (dynamic_parser, dynamic_regex),
+    "live": (live_parser, live_regex),
+    "clip": (clip_parser, clip_regex),
+    "audio": (audio_parser, audio_regex),
+    "video": (video_parser, video_regex),
+}
+
+# Short links and other pages fall back to the catch-all route of utils.push and are resolved first
+router.add_route("bili", ("t.bilibili.com", "h.bilibili.com"), kind="dynamic")
+router.add_route("bili", ("live.bilibili.com",), kind="live")
+router.add_route("bili", ("vc.bilibili.com",), kind="clip")
+router.add_route("bili", ("bilibili.com",), r"bilibili\.com/audio", kind="audio")
+router.add_route("bili", ("bilibili.com",), r"bilibili\.com/(?:video|bangumi/play)", kind="video")
+
+
+def is_canonical(url):
+    """Whether the parsers accept the url as it is, so it needs no redirect resolution."""
+    kind = router.kind(url, "bili")
+    return kind is not None and bool(parsers[kind][1].search(url))
+
+
 async def feedparser(url, video=True):
     if not url.startswith(("http:", "https:")):
         url = f"https://{url}"
-    async with aiohttp.ClientSession(headers=headers) as s:
-        async with s.get(url) as resp:
-            url = str(resp.url)
-            # dynamic
-            if re.search(r"[th]\.bilibili\.com", url):
-                f = await dynamic_parser(s, url)
-            # live image
-            elif re.search(r"live\.bilibili\.com", url):
-                f = await live_parser(s, url)
-            # vc video
-            elif re.search(r"vc\.bilibili\.com", url):
-                f = await clip_parser(s, url)
-            # au audio
-            elif re.search(r"bilibili\.com/audio", url):
-                f = await audio_parser(s, url)
-            # main video
-            elif re.search(r"bilibili\.com/(?:video|bangumi/play)", url):
-                if video:
-                    f = await video_parser(s, url)
-                else:
-                    logger.info(f"暂不匹配视频内容: {url}")
-                    return
-            else:
-                return
+    s = sessions.session("bilibili", headers=headers)
+    url = await short_links.resolve(s, url, is_canonical)
+    if (kind := router.kind(url, "bili")) is None:
+        return
+    if kind == "video" and not video:
+        logger.info(f"暂不匹配视频内容: {url}")
+        return
+    f = await parsers[kind][0](s, url)
     if f:
         logger.info(
             f"用户: {f.user_markdown}\n"
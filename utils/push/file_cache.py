@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import threading
+import time
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager, ExitStack
+from telegram import Message
+from telegram.error import BadRequest
+
+from utils import BaseConfig, register_stats
+from utils.store import SQLiteStore
+
+
+logger = logging.getLogger("push_helper")
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_ids (
+    fingerprint TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS file_ids_last_used ON file_ids (last_used);
+"""
+
+
+def fingerprint(source: str, content: Optional[bytes] = None, digest: Optional[bytes] = None) -> str:
+    '''Identify a piece of media by where it came from and, if already downloaded, by what it contains.
+
+    `digest` is the SHA-1 digest of the content, for content that is not held in memory.
+    '''
+    if content is not None:
+        digest = hashlib.sha1(content).digest()
+    result = hashlib.sha1(source.encode())
+    if digest is not None:
+        result.update(digest)
+    return result.hexdigest()
+
+
+def file_id_of(message: Message) -> Optional[Tuple[str, str]]:
+    if message.photo:
+        return message.photo[-1].file_id, "photo"
+    # An animation also carries a document, so it has to be checked first
+    for file_type in ("animation", "video", "audio", "document"):
+        if (attachment := getattr(message, file_type, None)) is not None:
+            return attachment.file_id, file_type
+    return None
+
+
+class FileIdCache:
+    '''Persistent LRU mapping from media fingerprints to the `file_id` Telegram assigned on the first upload.'''
+
+    class Config(BaseConfig, config_file="push_config.json"):
+        file_id_cache_path: Optional[str] = "file_id_cache.sqlite3"
+        file_id_cache_size: Optional[int] = 4096
+
+        @classmethod
+        def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+            return _attr_name, _attr_value
+
+    def __init__(self, path: str, size: int):
+        self.__store = SQLiteStore(path, _SCHEMA)
+        self.__size = size
+        self.__hits = 0
+        self.__misses = 0
+        self.__claims: Dict[str, List[Any]] = dict()
+        self.__claims_lock = threading.Lock()
+
+    def get(self, fp: str) -> Optional[Tuple[str, str]]:
+        with self.__store.transaction() as store:
+            rows = store.execute(
+                "SELECT file_id, file_type FROM file_ids WHERE fingerprint = ?", (fp,))
+            if rows:
+                store.execute(
+                    "UPDATE file_ids SET last_used = ? WHERE fingerprint = ?", (time.time(), fp))
+        if rows:
+            self.__hits += 1
+            return rows[0]
+        self.__misses += 1
+        return None
+
+    def put(self, fp: str, file_id: str, file_type: str) -> None:
+        with self.__store.transaction() as store:
+            store.execute(
+                "INSERT OR REPLACE INTO file_ids VALUES (?, ?, ?, ?)",
+                (fp, file_id, file_type, time.time()))
+            store.execute(
+                "DELETE FROM file_ids WHERE fingerprint IN ("
+                "SELECT fingerprint FROM file_ids ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.__size,))
+
+    def remember(self, fp: str, message: Message) -> None:
+        if (result := file_id_of(message)) is not None:
+            self.put(fp, *result)
+
+    def forget(self, fp: str) -> None:
+        self.__store.execute("DELETE FROM file_ids WHERE fingerprint = ?", (fp,))
+
+    @contextmanager
+    def claim(self, *fps: str) -> Iterator[None]:
+        '''Serialize uploads of the same media, so concurrent deliveries wait for the first `file_id` instead of uploading again.'''
+        fps = sorted(set(fps))
+        with self.__claims_lock:
+            claims = [self.__claims.setdefault(fp, [threading.Lock(), 0]) for fp in fps]
+            for claim in claims:
+                claim[1] += 1
+        try:
+            with ExitStack() as stack:
+                for lock, _ in claims:
+                    stack.enter_context(lock)
+                yield
+        finally:
+            with self.__claims_lock:
+                for fp, claim in zip(fps, claims):
+                    claim[1] -= 1
+                    if not claim[1]:
+                        self.__claims.pop(fp)
+
+    def deliver(self, fps: List[str], send: Callable[[List[Optional[Tuple[str, str]]]], List[Message]], what: str) -> List[Message]:
+        '''Call `send` with the cached `file_id` of each fingerprint, or None for the media it has to upload.
+
+        Media that is cached is sent without waiting on anyone. Otherwise only the first delivery uploads, holding the claim until the new `file_id`s are stored, and concurrent ones send those instead.
+        '''
+        used: List[Optional[Tuple[str, str]]] = list()
+
+        def attempt(cached: List[Optional[Tuple[str, str]]]) -> List[Message]:
+            used[:] = cached
+            return send(cached)
+
+        try:
+            return self.__deliver(fps, attempt)
+        except BadRequest:
+            if not any(used):
+                raise
+            # A cached file_id may have been invalidated on Telegram's side
+            logger.exception(f"使用缓存的 file_id 推送失败, 重新上传: {what}")
+            for fp in fps:
+                self.forget(fp)
+            return self.__deliver(fps, send)
+
+    def __deliver(self, fps: List[str], send: Callable[[List[Optional[Tuple[str, str]]]], List[Message]]) -> List[Message]:
+        cached = [self.get(fp) for fp in fps]
+        if not all(cached):
+            with self.claim(*(fp for fp, file_id in zip(fps, cached) if file_id is None)):
+                # Whoever held the claim before may have uploaded in the meantime
+                cached = [file_id or self.get(fp) for fp, file_id in zip(fps, cached)]
+                if not all(cached):
+                    messages = send(cached)
+                    for fp, message in zip(fps, messages):
+                        self.remember(fp, message)
+                    return messages
+        return send(cached)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.__hits + self.__misses
+        return {
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "hit_ratio": self.__hits / total if total else 0.0,
+            "entries": self.__store.execute("SELECT COUNT(*) FROM file_ids")[0][0],
+        }
+
+
+file_ids = FileIdCache(FileIdCache.Config.file_id_cache_path, FileIdCache.Config.file_id_cache_size)
+register_stats("file_ids", file_ids.stats)
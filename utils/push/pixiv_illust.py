@@ -1,9 +1,11 @@
-import asyncio
 import logging
 
+from functools import cached_property
 from bs4 import BeautifulSoup
-from pixivpy_async import AppPixivAPI
-from pixivpy_async.net import Net
+
+from utils import event_loop
+from utils.metrics import stage_seconds
+from utils.transcode import transcode
 
 
 class DownloadError(Exception):
@@ -30,20 +32,13 @@ logger = logging.getLogger("push_helper")
 
 class Illust:
 
-    aapi = AppPixivAPI(env=True)
-
-    def __init__(self, illust_id: int, refresh_token:str):
-        async def init_appapi() -> bool:
-            try:
-                await self.aapi.login(refresh_token=refresh_token)
-            except:
-                return False
-            self.aapi.set_accept_language("zh-CN")
-            return True
-
+    def __init__(self, illust_id: int, session):
         async def get_info() -> bool:
             try:
-                json_result = await self.aapi.illust_detail(self.id)
+                with stage_seconds.time(stage="api", backend="pixiv"):
+                    json_result = await self.session.call("illust_detail", self.id)
+            except LoginError:
+                raise
             except:
                 return False
 
@@ -70,26 +65,21 @@ class Illust:
 
             return True
 
-        loop = asyncio.new_event_loop()
-        login_result = loop.run_until_complete(init_appapi())
-        loop.close()
-        if not login_result:
-            logger.exception("Pixiv 登录失败")
-            raise LoginError
-        logger.info("Pixiv 登录成功")
-
+        self.session = session
         self.id: int = illust_id
 
         self.__images: list = list()
 
-        loop = asyncio.new_event_loop()
-        get_info_result = loop.run_until_complete(get_info())
-        loop.close()
+        get_info_result = event_loop.run(get_info())
         if not get_info_result:
             logger.exception("插画信息获取失败")
             raise GetInfoError
 
     def __str__(self):
+        return self.html
+
+    @cached_property
+    def html(self) -> str:
         tags_text = str()
         for tag in self.tags:
             tags_text = tags_text + \
@@ -102,13 +92,14 @@ class Illust:
 
     async def __download_single_image(self, url: str, size_hint: str, page_hint: int):
         try:
-            content, type = await self.aapi.down(url, "https://app-api.pixiv.net/")
+            with stage_seconds.time(stage="download", backend="pixiv"):
+                content, type = await self.session.down(url, "https://app-api.pixiv.net/")
         except:
             logger.exception(f"{self.id} {size_hint} 第 {page_hint} 张下载错误")
             raise DownloadError
 
         if type is not None and type.find("image") != -1:
-            self.__images.append((page_hint, content))
+            self.__images.append((page_hint, await transcode(content, name=url, backend="pixiv"), url))
         else:
             logger.exception(f"{self.id} {size_hint} 第 {page_hint} 张下载错误")
             raise DownloadError
@@ -117,7 +108,6 @@ class Illust:
 
     def __download_images(self, original: bool = False):
         page = 0
-        loop = asyncio.new_event_loop()
 
         if not original:
             urls = self.urls
@@ -131,14 +121,18 @@ class Illust:
             tasks.append(self.__download_single_image(url, size_hint, page))
             page = page + 1
 
-        try:
-            loop.run_until_complete(asyncio.gather(*tasks, loop=loop))
-        except DownloadError:
-            pass
-        finally:
-            loop.close()
+        # Waits for every download, so none is left appending to the images after this returns
+        results = event_loop.run(event_loop.gather(*tasks, return_exceptions=True))
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for error in errors:
+            # A failed download is already logged and leaves its page out, anything else is a bug
+            if not isinstance(error, DownloadError):
+                raise error
 
-        logger.info(f"成功下载 {self.id} 全部 {size_hint} 图片")
+        if errors:
+            logger.warning(f"{self.id} {size_hint} 图片中有 {len(errors)} 张下载失败")
+        else:
+            logger.info(f"成功下载 {self.id} 全部 {size_hint} 图片")
 
     def download(self):
         self.__download_images()
@@ -153,3 +147,11 @@ class Illust:
         self.__images.sort(key=lambda elem: elem[0])
 
         return [elem[1] for elem in self.__images[:9]]
+
+    def get_downloaded_media(self):
+        if not len(self.__images):
+            return None
+
+        self.__images.sort(key=lambda elem: elem[0])
+
+        return [(elem[2], elem[1]) for elem in self.__images[:9]]
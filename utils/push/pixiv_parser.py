@@ -7,22 +7,24 @@ from telegram import (
 )
 from typing import (
     Any,
+    Optional,
     Tuple,
 )
-from pixivpy_async import AppPixivAPI
 import logging
 import re
 from utils import BaseConfig
 from io import BytesIO
 
 from .pixiv_illust import Illust, IllustInitError
+from .file_cache import file_ids, fingerprint
+from .pixiv_session import PixivSession
+from .router import Backend, router
 
 logger = logging.getLogger("push_helper")
 
 
 class PixivParser:
     status = False
-    aapi = AppPixivAPI()
     id_regex = r"[1-9]\d*"
 
     class Config(BaseConfig, config_file="push_config.json"):
@@ -35,35 +37,60 @@ class PixivParser:
             else:
                 return _attr_name, _attr_value
 
-    @classmethod
-    def send(self, url: str, classification: str, bot: Bot, target):
-
-        def origin_link_button(_id: int) -> InlineKeyboardMarkup:
-            return InlineKeyboardMarkup([[InlineKeyboardButton(text="原链接", url=f"https://www.pixiv.net/artworks/{_id}")]])
+    session = PixivSession(Config)
 
+    @classmethod
+    def resolve(self, url: str) -> Optional[Illust]:
         illust_id = int(re.search(pattern=self.id_regex, string=url).group(0))
 
         try:
-            illust = Illust(illust_id, self.Config.pixiv_refresh_token)
+            illust = Illust(illust_id, self.session)
         except IllustInitError:
-            return
+            return None
 
         illust.download()
 
-        images = illust.get_downloaded_images()
-
-        if len(images) > 1:
-            bot.send_media_group(chat_id=target, media=[
-                InputMediaPhoto(BytesIO(image)) for image in images])
-            bot.send_message(text=str(illust), chat_id=target,
-                             reply_markup=origin_link_button(illust_id),
-                             disable_web_page_preview=True,
-                             parse_mode=ParseMode.HTML)
-        else:
-            print(str(illust))
-            bot.send_photo(photo=BytesIO(images[0]), chat_id=target,
-                           caption=str(illust),
-                           reply_markup=origin_link_button(illust_id),
-                           parse_mode=ParseMode.HTML)
+        if not illust.get_downloaded_images():
+            logger.warning(f"Pixiv: {illust_id} 没有可推送的图片")
+            return None
+        return illust
+
+    @classmethod
+    def deliver(self, illust: Illust, classification: str, bot: Bot, target):
+
+        def origin_link_button(_id: int) -> InlineKeyboardMarkup:
+            return InlineKeyboardMarkup([[InlineKeyboardButton(text="原链接", url=f"https://www.pixiv.net/artworks/{_id}")]])
+
+        def send(cached: list):
+            images = [
+                file_id[0] if file_id else BytesIO(content)
+                for file_id, (_, content) in zip(cached, media)
+            ]
+            if len(images) > 1:
+                messages = bot.send_media_group(chat_id=target, media=[
+                    InputMediaPhoto(image) for image in images])
+                bot.send_message(text=illust.html, chat_id=target,
+                                 reply_markup=origin_link_button(illust.id),
+                                 disable_web_page_preview=True,
+                                 parse_mode=ParseMode.HTML)
+            else:
+                messages = [bot.send_photo(photo=images[0], chat_id=target,
+                                           caption=illust.html,
+                                           reply_markup=origin_link_button(illust.id),
+                                           parse_mode=ParseMode.HTML)]
+            return messages
+
+        media = illust.get_downloaded_media()
+        fps = [fingerprint(url, content) for url, content in media]
+
+        file_ids.deliver(fps, send, f"Pixiv {illust.id}")
 
         logger.info(f"Pixiv: 成功推送 {illust.id}")
+
+    @classmethod
+    def send(self, url: str, classification: str, bot: Bot, target):
+        if (illust := self.resolve(url)) is not None:
+            self.deliver(illust, classification, bot, target)
+
+
+router.add_backend(Backend("pixiv", PixivParser.resolve, PixivParser.deliver, warm_up=PixivParser.session.warm_up))
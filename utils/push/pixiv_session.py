@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+
+from typing import Any, Optional, Tuple
+from pixivpy_async import AppPixivAPI
+
+from utils import event_loop, sessions
+from .pixiv_illust import LoginError
+
+
+logger = logging.getLogger("push_helper")
+
+
+def _is_auth_error(result: Any) -> bool:
+    try:
+        message = result["error"]["message"]
+    except (KeyError, TypeError):
+        return False
+    return "invalid_grant" in str(message) or "OAuth" in str(message)
+
+
+class PixivSession:
+    '''Keeps one logged-in `AppPixivAPI` alive and refreshes its access token shortly before it expires.
+
+    `config` must provide `pixiv_refresh_token` and `dump()`; the rotated refresh token is written back through it.
+    '''
+
+    REFRESH_MARGIN: float = 300
+    DEFAULT_EXPIRES_IN: float = 3600
+
+    def __init__(self, config):
+        self.__config = config
+        self.__api: Optional[AppPixivAPI] = None
+        self.__expires_at: float = 0
+        self.__lock: Optional[asyncio.Lock] = None
+        self.__refresh_handle: Optional[asyncio.TimerHandle] = None
+
+    @ property
+    def api(self) -> AppPixivAPI:
+        if self.__api is None:
+            self.__api = AppPixivAPI(env=True)
+            self.__api.set_accept_language("zh-CN")
+        # The HTTP session lives on the background loop and may be recreated after a shutdown
+        self.__api.session = sessions.session("pixiv", trust_env=True)
+        return self.__api
+
+    @ property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.__expires_at - self.REFRESH_MARGIN
+
+    async def login(self, force: bool = False) -> None:
+        if self.__lock is None:
+            self.__lock = asyncio.Lock()
+        async with self.__lock:
+            if not (force or self.expired):
+                return
+            api = self.api
+            try:
+                token = await api.login(refresh_token=api.refresh_token or self.__config.pixiv_refresh_token)
+            except Exception as exc:
+                self.__expires_at = 0
+                logger.exception("Pixiv 登录失败")
+                raise LoginError() from exc
+            try:
+                expires_in = float(token.response.expires_in)
+            except (AttributeError, TypeError, ValueError):
+                expires_in = self.DEFAULT_EXPIRES_IN
+            self.__expires_at = time.monotonic() + expires_in
+            self.__schedule_refresh(expires_in - self.REFRESH_MARGIN)
+            logger.info(f"Pixiv 登录成功, {expires_in:.0f} 秒后过期")
+
+            if api.refresh_token and api.refresh_token != self.__config.pixiv_refresh_token:
+                self.__config.pixiv_refresh_token = api.refresh_token
+                await asyncio.get_running_loop().run_in_executor(None, self.__config.dump)
+                logger.info("已保存新的 Pixiv refresh_token")
+
+    def __schedule_refresh(self, delay: float):
+        def refresh():
+            task = asyncio.ensure_future(self.login(force=True))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        if self.__refresh_handle is not None:
+            self.__refresh_handle.cancel()
+        self.__refresh_handle = asyncio.get_running_loop().call_later(max(delay, 0), refresh)
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        '''Call an `AppPixivAPI` method with a valid token, logging in again and retrying once on an authentication error.'''
+        await self.login()
+        result = await getattr(self.api, method)(*args, **kwargs)
+        if _is_auth_error(result):
+            logger.info("Pixiv access_token 失效, 重新登录")
+            await self.login(force=True)
+            result = await getattr(self.api, method)(*args, **kwargs)
+        return result
+
+    async def down(self, url: str, referer: str) -> Tuple[bytes, str]:
+        '''Download `url`, returning the content and its content type.'''
+        # `AppPixivAPI.down` resolves to an async generator, yielding the content type first when asked for it, then the content
+        parts = await self.api.down(url, referer, True)
+        content_type, content = [part async for part in parts]
+        return content, content_type
+
+    def warm_up(self) -> None:
+        '''Start logging in on the background loop without waiting for it.'''
+        if not self.__config.pixiv_refresh_token:
+            return
+        future = event_loop.submit(self.login())
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
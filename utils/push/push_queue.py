@@ -0,0 +1,95 @@
+import json
+import logging
+import threading
+
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from collections.abc import MutableMapping
+
+from utils import BaseConfig
+from utils.store import SQLiteStore
+
+
+logger = logging.getLogger("push_helper")
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS waiting_to_push (
+    message_id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+
+class PushQueue(MutableMapping):
+    '''The queue of messages waiting to be pushed, keyed by the message id in the watcher, and mirrored to SQLite.
+
+    Mutating a queued message in place does not reach the store by itself; call `save(message_id)` afterwards.
+    '''
+
+    class Config(BaseConfig, config_file="push_config.json"):
+        push_queue_path: Optional[str] = "push_queue.sqlite3"
+
+        @classmethod
+        def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+            return _attr_name, _attr_value
+
+    def __init__(self, path: str, encode: Callable[[Any], Dict[str, Any]], decode: Callable[[Dict[str, Any]], Any]):
+        self.__lock = threading.RLock()
+        self.__encode = encode
+        self.__store = SQLiteStore(path, _SCHEMA)
+        self.__messages: Dict[int, Any] = dict()
+        self.__position = 0
+        for message_id, position, data in self.__store.execute(
+                "SELECT message_id, position, data FROM waiting_to_push ORDER BY position"):
+            try:
+                self.__messages[message_id] = decode(json.loads(data))
+            except Exception:
+                logger.exception(f"无法恢复推送队列中的消息 {message_id}")
+            self.__position = position
+        if self.__messages:
+            logger.info(f"已恢复推送队列中的 {len(self.__messages)} 条消息")
+
+    def __getitem__(self, message_id: int) -> Any:
+        return self.__messages[message_id]
+
+    def __setitem__(self, message_id: int, message: Any) -> None:
+        with self.__lock:
+            self.__messages[message_id] = message
+            self.__position += 1
+            self.__store.execute(
+                "INSERT OR REPLACE INTO waiting_to_push VALUES (?, ?, ?)",
+                (message_id, self.__position, json.dumps(self.__encode(message), ensure_ascii=False)))
+
+    def __delitem__(self, message_id: int) -> None:
+        with self.__lock:
+            del self.__messages[message_id]
+            self.__store.execute("DELETE FROM waiting_to_push WHERE message_id = ?", (message_id,))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self.__messages))
+
+    def __len__(self) -> int:
+        return len(self.__messages)
+
+    def __contains__(self, message_id: object) -> bool:
+        return message_id in self.__messages
+
+    def __repr__(self) -> str:
+        return repr(self.__messages)
+
+    def save(self, message_id: int) -> None:
+        '''Write the current state of a queued message, keeping its place in the queue.'''
+        with self.__lock:
+            try:
+                message = self.__messages[message_id]
+            except KeyError:
+                return
+            self.__store.execute(
+                "UPDATE waiting_to_push SET data = ? WHERE message_id = ?",
+                (json.dumps(self.__encode(message), ensure_ascii=False), message_id))
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__messages.clear()
+            self.__store.execute("DELETE FROM waiting_to_push")
@@ -0,0 +1,124 @@
+import re
+import threading
+
+from importlib import import_module
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Pattern
+from telegram import Bot
+
+
+_host = re.compile(r"(?i)(?:[a-z][a-z0-9+.-]*://)?((?:[a-z0-9-]+\.)+[a-z]{2,})(?=[/:?#\s]|$)")
+
+
+class Backend(NamedTuple):
+    '''A source of pushes.
+
+    `resolve(url)` fetches everything needed to send the url once, or returns `None` if it cannot be pushed. `deliver(content, classification, bot, target)` sends the resolved content to one target, `classification` being the rendered tags with `tag_prefix`.
+    `warm_up()`, if given, prepares the backend ahead of its first use without blocking.
+    '''
+    name: str
+    resolve: Callable[[str], Any]
+    deliver: Callable[[Any, str, Bot, Any], Any]
+    tag_prefix: str = "#"
+    warm_up: Optional[Callable[[], Any]] = None
+
+
+class Route(NamedTuple):
+    backend: Backend
+    kind: Optional[str] = None
+
+
+class _Rule(NamedTuple):
+    fallback: bool
+    order: int
+    backend: str
+    pattern: Optional[Pattern]
+    kind: Optional[str]
+
+
+def _suffixes(host: str) -> Iterator[str]:
+    '''`a.b.example.com` -> `a.b.example.com`, `b.example.com`, `example.com`'''
+    labels = host.lower().split(".")
+    for i in range(len(labels) - 1):
+        yield ".".join(labels[i:])
+
+
+class Router:
+    '''Classifies urls by host first and only then by the precompiled patterns registered for that host.
+
+    Rules registered earlier take precedence, and fallback rules are only tried after all others for the same host. If several urls appear in the text, the first one that matches any rule decides.
+    A backend can be declared by the module that registers it, which is then imported the first time a url is routed to it.
+    '''
+
+    def __init__(self):
+        self.__backends: Dict[str, Backend] = dict()
+        self.__modules: Dict[str, str] = dict()
+        self.__import_lock = threading.RLock()
+        self.__rules: Dict[str, List[_Rule]] = dict()
+        self.__host_rules: Dict[str, List[_Rule]] = dict()
+        self.__order = 0
+        self.__default: Optional[str] = None
+
+    def add_backend(self, backend: Backend, default: bool = False) -> None:
+        self.__backends[backend.name] = backend
+        if default:
+            self.__default = backend.name
+
+    def add_backend_module(self, name: str, module: str) -> None:
+        '''Declare that importing `module` registers the backend `name`.'''
+        self.__modules[name] = module
+
+    def backend(self, name: str) -> Optional[Backend]:
+        try:
+            return self.__backends[name]
+        except KeyError:
+            if name not in self.__modules:
+                return None
+        with self.__import_lock:
+            if name not in self.__backends:
+                import_module(self.__modules[name])
+            return self.__backends.get(name)
+
+    def add_route(self, backend: str, hosts: Iterable[str], pattern: Optional[str] = None, kind: Optional[str] = None, fallback: bool = False) -> None:
+        '''Route urls on `hosts` or their subdomains to `backend`, if they also match `pattern`.'''
+        rule = _Rule(fallback, self.__order, backend, re.compile(pattern) if pattern else None, kind)
+        self.__order += 1
+        for host in hosts:
+            self.__rules.setdefault(host.lower(), list()).append(rule)
+        self.__host_rules.clear()
+
+    def __rules_for(self, host: str) -> List[_Rule]:
+        try:
+            return self.__host_rules[host]
+        except KeyError:
+            rules = sorted(rule for suffix in _suffixes(host) for rule in self.__rules.get(suffix, ()))
+            if len(self.__host_rules) < 1024:
+                self.__host_rules[host] = rules
+            return rules
+
+    def match(self, url: str) -> Optional[_Rule]:
+        for host in _host.findall(url):
+            for rule in self.__rules_for(host.lower()):
+                if rule.pattern is None or rule.pattern.search(url):
+                    return rule
+        return None
+
+    def route(self, url: str) -> Optional[Route]:
+        '''The backend and kind for `url`, falling back to the default backend. Returns `None` only without a default.'''
+        if (rule := self.match(url)) is not None and rule.backend not in self.__backends:
+            # Loading the backend may register more specific routes
+            self.backend(rule.backend)
+            rule = self.match(url)
+        if rule is not None and (backend := self.__backends.get(rule.backend)) is not None:
+            return Route(backend, rule.kind)
+        if self.__default is not None:
+            return Route(self.__backends[self.__default])
+        return None
+
+    def kind(self, url: str, backend: str) -> Optional[str]:
+        '''The kind of `url` within `backend`, or `None` if it is not routed there.'''
+        if (rule := self.match(url)) is not None and rule.backend == backend:
+            return rule.kind
+        return None
+
+
+router = Router()
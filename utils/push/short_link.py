@@ -0,0 +1,97 @@
+import logging
+import time
+
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from aiohttp import ClientSession
+
+from utils import BaseConfig, register_stats
+from utils.store import SQLiteStore
+
+
+logger = logging.getLogger("push_helper")
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS short_links (
+    code TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+_REDIRECT_STATUS = (301, 302, 303, 307, 308)
+_MAX_REDIRECTS = 10
+
+
+class ShortLinkResolver:
+    '''Resolves links to the url they finally point to, by following `Location` headers without downloading any body.
+
+    Links already accepted by `is_canonical` are returned as they are, and the targets of short links are kept in SQLite, since a short code never changes its target.
+    '''
+
+    class Config(BaseConfig, config_file="push_config.json"):
+        short_link_cache_path: Optional[str] = "short_links.sqlite3"
+
+        @classmethod
+        def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+            return _attr_name, _attr_value
+
+    def __init__(self, path: str, short_hosts: Tuple[str, ...]):
+        self.__store = SQLiteStore(path, _SCHEMA)
+        self.__short_hosts = short_hosts
+        self.__skipped = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__requests = 0
+
+    def __short_code(self, url: str) -> Optional[str]:
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+        if host.startswith("www."):
+            host = host[len("www."):]
+        if host in self.__short_hosts and parts.path.strip("/"):
+            return f"{host}{parts.path.rstrip('/')}"
+        return None
+
+    async def resolve(self, s: ClientSession, url: str, is_canonical: Callable[[str], bool]) -> str:
+        if is_canonical(url):
+            self.__skipped += 1
+            return url
+        if (code := self.__short_code(url)) is not None:
+            if rows := self.__store.execute("SELECT url FROM short_links WHERE code = ?", (code,)):
+                self.__hits += 1
+                return rows[0][0]
+            self.__misses += 1
+
+        resolved = url
+        for _ in range(_MAX_REDIRECTS):
+            self.__requests += 1
+            async with s.get(resolved, allow_redirects=False) as resp:
+                location = resp.headers.get("Location")
+                if resp.status not in _REDIRECT_STATUS or not location:
+                    break
+            resolved = urljoin(resolved, location)
+            if is_canonical(resolved):
+                break
+        else:
+            logger.warning(f"重定向次数过多: {url}")
+
+        if code is not None and resolved != url:
+            self.__store.execute(
+                "INSERT OR REPLACE INTO short_links VALUES (?, ?, ?)", (code, resolved, time.time()))
+        return resolved
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "skipped": self.__skipped,
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "requests": self.__requests,
+            "entries": self.__store.execute("SELECT COUNT(*) FROM short_links")[0][0],
+        }
+
+
+short_links = ShortLinkResolver(ShortLinkResolver.Config.short_link_cache_path, ("b23.tv", "acg.tv"))
+register_stats("short_links", short_links.stats)
@@ -0,0 +1,136 @@
+import atexit
+import gzip
+import json
+import logging
+import threading
+import time
+
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Tuple, TextIO
+
+from telegram import Update
+from telegram.ext import CallbackContext, Dispatcher, TypeHandler
+
+from .config import BaseConfig, Config
+from .stats import register_stats
+
+if TYPE_CHECKING:
+    # aiohttp is only loaded once an HTTP session is needed, see `utils.sessions`
+    import aiohttp
+
+
+__all__ = (
+    'RecorderConfig',
+    'Recorder',
+    'recorder',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+
+class RecorderConfig(BaseConfig, config_file="push_config.json"):
+    record_path: Optional[str] = str()              # e.g. "traffic.jsonl.gz", empty to disable recording
+    record_max_body: Optional[int] = 1024 * 1024    # longer response bodies are recorded by size only
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+_TEXT_TYPES = ('application/json', 'text/', 'application/javascript', 'application/xml')
+
+
+class Recorder:
+    '''Appends incoming updates and upstream HTTP exchanges to a gzip-compressed JSON lines file.
+
+    Every record carries `t`, the seconds since recording started, so that a replay can keep the original pacing.
+    The first record is a `start` record with the wall clock time and the chats the bot was configured for.
+    '''
+
+    FLUSH_EVERY = 100
+
+    def __init__(self, path: str, max_body: int):
+        self.__path = path
+        self.__max_body = max_body
+        self.__file: Optional[TextIO] = None
+        self.__started = 0.0
+        self.__lock = threading.Lock()
+        self.__counts: Dict[str, int] = dict()
+        self.__pending = 0
+
+    @ property
+    def enabled(self) -> bool:
+        return bool(self.__path)
+
+    def __open(self):
+        # gzip files may consist of several members, so appending to an earlier recording keeps it readable
+        self.__file = gzip.open(self.__path, 'at', encoding='utf8')
+        self.__started = time.monotonic()
+        self.__write('start', {
+            'time': time.time(),
+            'config': {
+                'tags': list(Config.tags),
+                'targets': list(Config.targets),
+                'watchers': list(Config.watchers),
+                'forward': Config.forward,
+            },
+        })
+        logger.info(f"开始记录更新与上游请求至 {self.__path}")
+
+    def __write(self, kind: str, fields: Dict[str, Any]):
+        record = {'t': round(time.monotonic() - self.__started, 6), 'kind': kind}
+        record.update(fields)
+        self.__file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.__counts[kind] = self.__counts.get(kind, 0) + 1
+        self.__pending += 1
+        if self.__pending >= self.FLUSH_EVERY:
+            self.__file.flush()
+            self.__pending = 0
+
+    def write(self, kind: str, **fields: Any) -> None:
+        if not self.enabled:
+            return
+        with self.__lock:
+            if self.__file is None:
+                self.__open()
+            self.__write(kind, fields)
+
+    def record_update(self, update: Update, context: CallbackContext) -> None:
+        self.write('update', update=update.to_dict())
+
+    def record_response(self, response: 'aiohttp.ClientResponse', body: Optional[bytes]) -> None:
+        content_type = response.headers.get('Content-Type', '')
+        fields = {
+            'method': response.method,
+            'host': response.request_info.headers.get('X-Forwarded-Host', response.url.host),
+            'url': str(response.url),
+            'status': response.status,
+            'content_type': content_type,
+            'size': len(body) if body is not None else response.content_length,
+            'body': None,
+        }
+        if body is not None and len(body) <= self.__max_body and content_type.startswith(_TEXT_TYPES):
+            fields['body'] = body.decode(response.get_encoding(), 'replace')
+        self.write('http', **fields)
+
+    def record_admins(self, admins: Iterable[int]) -> None:
+        self.write('admins', ids=sorted(admins))
+
+    def register(self, dispatcher: Dispatcher) -> None:
+        '''Record every update before any other handler sees it.'''
+        if self.enabled:
+            dispatcher.add_handler(TypeHandler(Update, self.record_update), group=-2)
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {'path': self.__path, **self.__counts}
+
+
+recorder = Recorder(RecorderConfig.record_path, RecorderConfig.record_max_body)
+atexit.register(recorder.close)
+register_stats('recorder', recorder.stats)
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import tempfile
+import weakref
+
+from io import BytesIO
+from typing import Any, BinaryIO, Optional, Tuple
+from aiohttp import ClientResponse
+
+from .config import BaseConfig
+
+
+__all__ = (
+    'RelayConfig',
+    'MediaTooLarge',
+    'Spool',
+    'spool_response',
+)
+
+
+class RelayConfig(BaseConfig, config_file="push_config.json"):
+    relay_max_size: Optional[int] = 50 * 1024 * 1024      # Telegram refuses larger uploads from bots
+    relay_memory_size: Optional[int] = 1024 * 1024       # larger downloads are spooled to disk
+    relay_chunk_size: Optional[int] = 64 * 1024
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+class MediaTooLarge(Exception):
+    def __init__(self, url: str, size: int):
+        super().__init__(f"{url} 超过大小上限: {size} 字节")
+        self.url = url
+        self.size = size
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class Spool:
+    '''Downloaded content, kept in memory while small and in a temporary file otherwise.
+
+    It can be opened any number of times, so one download serves every target. The temporary file is removed together with the object.
+    '''
+
+    def __init__(self, memory_size: int):
+        self.__memory_size = memory_size
+        self.__buffer: Optional[BytesIO] = BytesIO()
+        self.__file: Optional[BinaryIO] = None
+        self.__data: Optional[bytes] = None
+        self.__path: Optional[str] = None
+        self.__sha1 = hashlib.sha1()
+        self.size = 0
+
+    @ classmethod
+    def from_bytes(cls, data: bytes) -> 'Spool':
+        spool = cls(len(data))
+        spool.write(data)
+        spool.finish()
+        return spool
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        self.__sha1.update(chunk)
+        if self.__file is None and self.size > self.__memory_size:
+            self.__file = tempfile.NamedTemporaryFile(prefix="push_helper_", delete=False)
+            self.__path = self.__file.name
+            weakref.finalize(self, _unlink, self.__path)
+            self.__file.write(self.__buffer.getvalue())
+            self.__buffer = None
+        if self.__file is not None:
+            self.__file.write(chunk)
+        else:
+            self.__buffer.write(chunk)
+
+    def finish(self) -> None:
+        if self.__file is not None:
+            self.__file.close()
+        else:
+            self.__data = self.__buffer.getvalue()
+            self.__buffer = None
+
+    @ property
+    def digest(self) -> bytes:
+        return self.__sha1.digest()
+
+    def open(self) -> BinaryIO:
+        '''A new reader positioned at the start.'''
+        if self.__path is not None:
+            return open(self.__path, "rb")
+        return BytesIO(self.__data)
+
+    def getvalue(self) -> bytes:
+        if self.__path is not None:
+            with open(self.__path, "rb") as file:
+                return file.read()
+        return self.__data
+
+
+async def spool_response(resp: ClientResponse, max_size: Optional[int] = None) -> Spool:
+    '''Read a response body chunk by chunk, without ever holding more than `relay_memory_size` of it in memory.
+
+    Raises `MediaTooLarge` as soon as the body is known to exceed `max_size`, from `Content-Length` when the server sends one.
+    '''
+    max_size = max_size or RelayConfig.relay_max_size
+    url = str(resp.url)
+    if resp.content_length is not None and resp.content_length > max_size:
+        raise MediaTooLarge(url, resp.content_length)
+    spool = Spool(RelayConfig.relay_memory_size)
+    async for chunk in resp.content.iter_chunked(RelayConfig.relay_chunk_size):
+        spool.write(chunk)
+        if spool.size > max_size:
+            spool.finish()
+            raise MediaTooLarge(url, spool.size)
+    spool.finish()
+    return spool
@@ -0,0 +1,111 @@
+import logging
+import threading
+
+from typing import Any, Dict, Optional, Tuple
+from concurrent.futures import Future, TimeoutError
+from telegram import Message, Update
+from telegram.ext import CallbackContext, DispatcherHandlerStop, Dispatcher, Filters, MessageFilter, MessageHandler
+
+from .config import BaseConfig
+from .stats import register_stats
+from .timeout_wrapper import TimeLimitReached
+
+
+__all__ = (
+    'ReplyConfig',
+    'ReplyRegistry',
+    'replies',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+
+class ReplyConfig(BaseConfig, config_file="push_config.json"):
+    reply_timeout: Optional[float] = 60.0
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+_Key = Tuple[int, int]
+
+
+class ReplyRegistry:
+    '''Prompts waiting for a reply, keyed by the chat and the id of the prompt message.
+
+    A handler ahead of all others fills the future of the prompt a message replies to, so waiting neither touches the update queue nor holds up the dispatcher.
+    '''
+
+    def __init__(self):
+        self.__waiting: Dict[_Key, Future] = dict()
+        self.__lock = threading.Lock()
+        self.__answered = 0
+        self.__timed_out = 0
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.__waiting
+
+    @ staticmethod
+    def key(message: Message) -> _Key:
+        return message.chat.id, message.message_id
+
+    def expect(self, prompt: Message) -> Future:
+        '''The future that the first reply to `prompt` will be set on.'''
+        future = Future()
+        with self.__lock:
+            self.__waiting[self.key(prompt)] = future
+        return future
+
+    def discard(self, prompt: Message) -> None:
+        with self.__lock:
+            future = self.__waiting.pop(self.key(prompt), None)
+        if future is not None:
+            future.cancel()
+
+    def wait(self, prompt: Message, timeout: Optional[float] = None) -> Message:
+        '''Block until `prompt` is replied to, for at most `timeout` seconds, `reply_timeout` by default.'''
+        timeout = ReplyConfig.reply_timeout if timeout is None else timeout
+        future = self.expect(prompt)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            self.__timed_out += 1
+            raise TimeLimitReached(f"Reached given time limit {timeout}s")
+        finally:
+            self.discard(prompt)
+
+    def on_reply(self, update: Update, context: CallbackContext) -> None:
+        message = update.effective_message
+        with self.__lock:
+            future = self.__waiting.pop(self.key(message.reply_to_message), None)
+        if future is not None and future.set_running_or_notify_cancel():
+            future.set_result(message)
+            self.__answered += 1
+            # The reply is consumed by the prompt, like it was taken off the update queue
+            raise DispatcherHandlerStop()
+
+    def register(self, dispatcher: Dispatcher) -> None:
+        dispatcher.add_handler(MessageHandler(
+            Filters.reply & _ReplyFilter(self), self.on_reply), group=-1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'waiting': len(self.__waiting),
+            'answered': self.__answered,
+            'timed_out': self.__timed_out,
+        }
+
+
+class _ReplyFilter(MessageFilter):
+    def __init__(self, registry: ReplyRegistry):
+        self.registry = registry
+        self.name = 'reply_filter'
+
+    def filter(self, message: Message) -> bool:
+        return ReplyRegistry.key(message.reply_to_message) in self.registry
+
+
+replies = ReplyRegistry()
+register_stats('replies', replies.stats)
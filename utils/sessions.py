@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import threading
+
+from typing import Any, Dict, Optional, Tuple
+from asyncio import AbstractEventLoop
+
+import aiohttp
+
+from multidict import CIMultiDict
+from yarl import URL
+
+from .config import BaseConfig
+from .recorder import recorder
+from .stats import register_stats
+
+
+__all__ = (
+    'SessionConfig',
+    'session',
+    'close_sessions',
+    'session_stats',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+
+class SessionConfig(BaseConfig, config_file="push_config.json"):
+    http_pool_limit: Optional[int] = 100
+    http_pool_limit_per_host: Optional[int] = 10
+    http_keepalive_timeout: Optional[float] = 30.0
+    http_dns_cache_ttl: Optional[int] = 600
+    http_host_overrides: Optional[Dict[str, str]] = {}     # host -> base url serving it instead, e.g. local stand-ins
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+# Sessions are bound to the loop they are created on, hence one connector and
+# one set of named sessions per loop.
+_connectors: Dict[AbstractEventLoop, aiohttp.TCPConnector] = {}
+_sessions: Dict[Tuple[AbstractEventLoop, str], aiohttp.ClientSession] = {}
+
+_counters: Dict[str, int] = {
+    'connection_reused': 0,
+    'connection_created': 0,
+    'dns_cache_hit': 0,
+    'dns_cache_miss': 0,
+}
+_counters_lock = threading.Lock()
+
+
+def _count(name: str):
+    async def on_event(session, context, params):
+        with _counters_lock:
+            _counters[name] += 1
+    return on_event
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_reuseconn.append(_count('connection_reused'))
+    trace.on_connection_create_end.append(_count('connection_created'))
+    trace.on_dns_cache_hit.append(_count('dns_cache_hit'))
+    trace.on_dns_cache_miss.append(_count('dns_cache_miss'))
+    return trace
+
+
+class _OverriddenRequest(aiohttp.ClientRequest):
+    '''Sends requests for the hosts in `http_host_overrides` to the given base url, telling it the original host in `X-Forwarded-Host`.'''
+
+    def __init__(self, method: str, url: URL, *args, headers=None, **kwargs):
+        if (base := SessionConfig.http_host_overrides.get(url.host)) is not None:
+            headers = CIMultiDict(headers or {})
+            headers['X-Forwarded-Host'] = url.host
+            base = URL(base)
+            url = url.with_scheme(base.scheme).with_host(base.host).with_port(base.port)
+        super().__init__(method, url, *args, headers=headers, **kwargs)
+
+
+class _RecordingResponse(aiohttp.ClientResponse):
+    '''Records the exchange once the body has been read, or once the response is released without reading it, as streamed media are.'''
+    _recorded = False
+
+    async def read(self) -> bytes:
+        body = await super().read()
+        if not self._recorded:
+            self._recorded = True
+            recorder.record_response(self, body)
+        return body
+
+    def release(self) -> Any:
+        if not self._recorded:
+            self._recorded = True
+            recorder.record_response(self, None)
+        return super().release()
+
+
+def _connector(loop: AbstractEventLoop) -> aiohttp.TCPConnector:
+    try:
+        connector = _connectors[loop]
+    except KeyError:
+        pass
+    else:
+        if not connector.closed:
+            return connector
+    connector = _connectors[loop] = aiohttp.TCPConnector(
+        limit=SessionConfig.http_pool_limit,
+        limit_per_host=SessionConfig.http_pool_limit_per_host,
+        keepalive_timeout=SessionConfig.http_keepalive_timeout,
+        use_dns_cache=True,
+        ttl_dns_cache=SessionConfig.http_dns_cache_ttl,
+    )
+    return connector
+
+
+def session(name: str = 'default', **session_kwargs) -> aiohttp.ClientSession:
+    '''Return the long-lived session registered as `name` on the running loop, creating it on first use.
+
+    All sessions of a loop share one keep-alive connector, so connections and DNS entries are reused across callers.
+    `session_kwargs` are only applied when the session is created.
+    '''
+    loop = asyncio.get_running_loop()
+    key = (loop, name)
+    try:
+        ret = _sessions[key]
+    except KeyError:
+        pass
+    else:
+        if not ret.closed:
+            return ret
+    if SessionConfig.http_host_overrides:
+        session_kwargs.setdefault('request_class', _OverriddenRequest)
+    if recorder.enabled:
+        session_kwargs.setdefault('response_class', _RecordingResponse)
+    ret = _sessions[key] = aiohttp.ClientSession(
+        connector=_connector(loop),
+        connector_owner=False,
+        trace_configs=[_trace_config()],
+        **session_kwargs
+    )
+    return ret
+
+
+async def close_sessions() -> None:
+    '''Close every session and the connector owned by the running loop.'''
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _sessions if key[0] is loop]:
+        await _sessions.pop(key).close()
+    if (connector := _connectors.pop(loop, None)) is not None:
+        await connector.close()
+
+
+def session_stats() -> Dict[str, Any]:
+    with _counters_lock:
+        ret = dict(_counters)
+    total = ret['connection_reused'] + ret['connection_created']
+    ret['connection_reuse_ratio'] = ret['connection_reused'] / total if total else 0.0
+    ret['open_sessions'] = sum(not s.closed for s in _sessions.values())
+    return ret
+
+
+register_stats('sessions', session_stats)
@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+
+from importlib import import_module
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional
+
+from .stats import register_stats
+
+
+__all__ = (
+    'begin',
+    'timed_import',
+    'mark',
+    'watch_first_poll',
+    'ready',
+    'startup_report',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+
+_started: float = time.monotonic()
+_imports: Dict[str, float] = dict()
+_marks: Dict[str, float] = dict()
+
+
+def begin(started: float, name: str = 'utils') -> None:
+    '''Take `started` as the start of the process, and the time since then as the import time of `name`.'''
+    global _started
+    _started = started
+    _imports[name] = time.monotonic() - started
+
+
+def timed_import(name: str) -> ModuleType:
+    start = time.monotonic()
+    module = import_module(name)
+    _imports[name] = time.monotonic() - start
+    return module
+
+
+def mark(name: str) -> None:
+    '''Record the time since start at which `name` happened.'''
+    _marks[name] = time.monotonic() - _started
+
+
+class _FirstPollFilter(logging.Filter):
+    '''Notices the end of the first `getUpdates` through the debug record PTB logs for it, and drops all other debug records.'''
+
+    def __init__(self, bot_logger: logging.Logger, level: int, callbacks: List[Callable[[], Any]]):
+        super().__init__()
+        self.bot_logger = bot_logger
+        self.level = level
+        self.callbacks = callbacks
+        self.done = False
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        if record.msg == 'Exiting: %s' and record.args == ('get_updates',):
+            self.finish('first_get_updates')
+        return False
+
+    def finish(self, name: str) -> None:
+        with self.lock:
+            if self.done:
+                return
+            self.done = True
+        mark(name)
+        self.bot_logger.removeFilter(self)
+        self.bot_logger.setLevel(self.level)
+        logger.info(f"启动耗时: {_format()}")
+        for callback in self.callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception(f"启动后回调 {callback} 出错")
+
+
+_watch: Optional[_FirstPollFilter] = None
+
+
+def watch_first_poll(*callbacks: Callable[[], Any]) -> None:
+    '''Log the startup report once the first `getUpdates` has returned, then run `callbacks` in the polling thread.'''
+    global _watch
+    bot_logger = logging.getLogger('telegram.bot')
+    _watch = _FirstPollFilter(bot_logger, bot_logger.level, list(callbacks))
+    bot_logger.addFilter(_watch)
+    bot_logger.setLevel(logging.DEBUG)
+
+
+def ready(name: str) -> None:
+    '''Finish startup at `name` instead of the first `getUpdates`, for when updates are not polled.'''
+    if _watch is not None:
+        _watch.finish(name)
+
+
+def _format() -> str:
+    return ", ".join(
+        [f"导入 {name} {seconds:.3f} 秒" for name, seconds in _imports.items()]
+        + [f"{name} {seconds:.3f} 秒" for name, seconds in _marks.items()]
+    )
+
+
+def startup_report() -> Dict[str, Any]:
+    ret: Dict[str, Any] = {f"import {name}": seconds for name, seconds in _imports.items()}
+    ret.update(_marks)
+    return ret
+
+
+register_stats('startup', startup_report)
@@ -0,0 +1,29 @@
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+__all__ = (
+    'register_stats',
+    'collect_stats',
+)
+
+
+StatsProvider = Callable[[], Dict[str, Any]]
+
+_providers: Dict[str, StatsProvider] = {}
+
+
+def register_stats(name: str, provider: StatsProvider) -> None:
+    '''Register a callable returning a flat mapping of counters, shown by `/stats` in the interactive console.'''
+    _providers[name] = provider
+
+
+def collect_stats(names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    if names is None:
+        names = _providers.keys()
+    ret = dict()
+    for name in names:
+        try:
+            ret[name] = _providers[name]()
+        except KeyError:
+            continue
+    return ret
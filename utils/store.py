@@ -0,0 +1,51 @@
+import sqlite3
+import threading
+
+from typing import Any, Iterable, List, Sequence
+from contextlib import contextmanager
+
+from .config import File
+
+
+__all__ = (
+    'SQLiteStore',
+)
+
+
+class SQLiteStore:
+    '''A small thread-safe wrapper around one SQLite connection in WAL mode.
+
+    Writes commit without waiting for fsync (`synchronous=NORMAL`), which keeps them in the microsecond range while the database still survives a crash of the process.
+    '''
+
+    def __init__(self, path: File, schema: str):
+        self.__lock = threading.RLock()
+        self.__conn = sqlite3.connect(
+            str(path), check_same_thread=False, isolation_level=None)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.executescript(schema)
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        with self.__lock:
+            return self.__conn.execute(sql, params).fetchall()
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> None:
+        with self.__lock:
+            self.__conn.executemany(sql, seq_of_params)
+
+    @ contextmanager
+    def transaction(self):
+        with self.__lock:
+            self.__conn.execute("BEGIN")
+            try:
+                yield self
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+            else:
+                self.__conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__conn.close()
@@ -1,21 +1,27 @@
+import atexit
 import signal
 import asyncio
+import pickle
 import threading
-import sys
 import time
 import concurrent.futures as ftrs
+import multiprocessing
 
 from typing import *
-from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import Executor, ThreadPoolExecutor
 from asyncio import AbstractEventLoop
 from enum import Enum
-from functools import wraps, partial, singledispatch
+from functools import wraps, partial
 from inspect import iscoroutinefunction
-from queue import Empty
-from multiprocessing import Process, Queue
+from multiprocessing.connection import Connection, wait
+
+from . import event_loop
+from .config import BaseConfig
+from .stats import register_stats
 
 
 __all__ = (
+    'TimeoutConfig',
     'TimeLimitReached',
     'WrapType',
     'wrap_async',
@@ -23,6 +29,15 @@ __all__ = (
 )
 
 
+class TimeoutConfig(BaseConfig, config_file="push_config.json"):
+    timeout_process_workers: Optional[int] = 2
+    timeout_thread_workers: Optional[int] = 8
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
 class TimeLimitReached(RuntimeError):
     def __init__(self, message):
         self.message = message
@@ -82,14 +97,14 @@ def timeout(
         timeout_or_func = None,
         exception_type = TimeLimitReached,
         wrap_type = WrapType.PROCESS):
-    '''Used to wrap a function to raise exception after certain timeout. Note that the running function would not be aborted unless `wrap_type` is set to `WrapType.SIGNAL` or `WrapType.PROCESS`.
+    '''Used to wrap a function to raise exception after certain timeout. Note that the running function would not be aborted unless `wrap_type` is set to `WrapType.SIGNAL` or `WrapType.PROCESS`, or is `WrapType.ASYNC` and the function is a coroutine function.
 
     Args:
         timeout: Timeout in seconds. No timeout is applied if None is passed. If 0 is passed, when calling the wrapped function, an instant exception would be raised if `wrap_type` is `WrapType.MULTI_THREADING`, or would behave the same as None is passed under other `wrap_type`s.
 
         exception: The exception type to be raised when timeout happens.
 
-        wrap_type: Control the method of counting time. Note that the running function would be terminated only if `wrap_type` is `WrapType.SIGNAL` or `WrapType.PROCESS`.
+        wrap_type: Control the method of counting time. Note that the running function would be terminated only if `wrap_type` is `WrapType.SIGNAL` or `WrapType.PROCESS`. Coroutine functions under `WrapType.ASYNC` run on the shared event loop and are cancelled on timeout. `WrapType.ASYNC` and `WrapType.FUTURE` also stop waiting once the budget of the current `event_loop.CancelScope` runs out.
     '''
 
     if callable(timeout_or_func):
@@ -122,14 +137,13 @@ def _timeout(timeout, exception_type, wrap_type):
     def decorator_async(func: Callable[..., Any]) -> Callable[..., Any]:
         @ wraps(func)
         def wrapped(*args, timeout: float = timeout, **kwargs):
-            loop = asyncio.new_event_loop()
-            afunc = func if iscoroutinefunction(func) else wrap_async(loop)(func)
+            if not iscoroutinefunction(func):
+                # A plain function cannot be cancelled, so it is only waited for like under `WrapType.FUTURE`
+                return _wait_thread(func, args, kwargs, timeout or None, exception_type)
             try:
-                return loop.run_until_complete(asyncio.wait_for(afunc(*args, **kwargs), timeout))
-            except asyncio.TimeoutError as exc:
+                return event_loop.run(func(*args, **kwargs), timeout or None)
+            except ftrs.TimeoutError as exc:
                 _raise_exception(exception_type, timeout, func, exc)
-            finally:
-                loop.close()
 
         return wrapped
 
@@ -137,16 +151,7 @@ def _timeout(timeout, exception_type, wrap_type):
     def decorator_future(func: Callable[..., Any]) -> Callable[..., Any]:
         @ wraps(func)
         def wrapped(*args, timeout: float = timeout, **kwargs):
-            with ThreadPoolExecutor(max_workers=1) as pool:
-                try:
-                    future = pool.submit(func, *args, **kwargs)
-                    result = future.result(timeout=timeout)
-                except ftrs.TimeoutError as exc:
-                    _raise_exception(exception_type, timeout, func, exc)
-                else:
-                    return result
-                finally:
-                    pool.shutdown(wait=False)
+            return _wait_thread(func, args, kwargs, timeout, exception_type)
 
         return wrapped
 
@@ -157,17 +162,11 @@ def _timeout(timeout, exception_type, wrap_type):
             def handler(exc: Optional[Exception] = None):
                 _raise_exception(exception_type, timeout, func, exc)
 
-            timeout = 0 if timeout is None else timeout
-            proc = _MultiProcessTimer(
-                func,
-                timeout,
-                handler
-            )
-            flag, ret = proc(*args, **kwargs)
+            flag, ret = _process_pool(func, args, kwargs, timeout or None)
             if flag:
                 return ret
             else:
-                handler()
+                handler(ret)
 
         return wrapped
 
@@ -176,14 +175,35 @@ def _timeout(timeout, exception_type, wrap_type):
         '''
         Return value of the wrapped callable must be a tuple `(flag: bool, return_value: Any)`.
         The callable should not be blocking. `flag` in the return value will be used to indicate running status.
+
+        Between two calls the wrapper sleeps, starting from 1ms and doubling up to 50ms. If a `threading.Condition` is passed as `condition`, the callable is called with it held and the wrapper waits on it instead, so whoever changes the state should notify it.
         '''
         @ wraps(func)
-        def wrapped(*args, timeout: float = timeout, **kwargs):
-            original_time = time.perf_counter()
-            while time.perf_counter() - original_time <= timeout:
-                flag, ret = func(*args, **kwargs)
-                if flag:
-                    return ret
+        def wrapped(*args, timeout: float = timeout, condition: Optional[threading.Condition] = None, **kwargs):
+            deadline = None if timeout is None else time.perf_counter() + timeout
+
+            def remaining() -> Optional[float]:
+                return None if deadline is None else deadline - time.perf_counter()
+
+            if condition is not None:
+                with condition:
+                    while True:
+                        flag, ret = func(*args, **kwargs)
+                        if flag:
+                            return ret
+                        if (left := remaining()) is not None and left <= 0:
+                            break
+                        condition.wait(left)
+            else:
+                delay = _TIMER_MIN_DELAY
+                while True:
+                    flag, ret = func(*args, **kwargs)
+                    if flag:
+                        return ret
+                    if (left := remaining()) is not None and left <= 0:
+                        break
+                    time.sleep(delay if left is None else min(delay, left))
+                    delay = min(delay * 2, _TIMER_MAX_DELAY)
             _raise_exception(exception_type, timeout, func)
 
         return wrapped
@@ -199,35 +219,236 @@ def _timeout(timeout, exception_type, wrap_type):
     return mapping[wrap_type]
 
 
-class _MultiProcessTimer():
-    def __init__(
-            self,
-            func: Callable[..., Any],
-            timeout: float,
-            handler: Callable[..., Any]):
+_TIMER_MIN_DELAY = 0.001
+_TIMER_MAX_DELAY = 0.05
+
 
-        self.__func = func
-        self.__time = timeout
-        self.__handler = handler
-        self.__queue = Queue(1)
+class _ThreadPool:
+    '''The bounded thread pool shared by all `WrapType.FUTURE` calls, created on first use.
 
+    A call that times out cannot be stopped. It is cancelled if it has not started yet, otherwise it is counted as abandoned until it finishes, and keeps its worker busy until then.
+    '''
 
-    def __call__(self, *args, **kwargs):
-        def __target():
+    def __init__(self, workers: int):
+        self.__workers = max(workers, 1)
+        self.__pool: Optional[ThreadPoolExecutor] = None
+        self.__lock = threading.Lock()
+
+        self.__calls = 0
+        self.__timeouts = 0
+        self.__cancelled = 0
+        self.__abandoned = 0
+        self.__abandoned_total = 0
+
+    def __get_pool(self) -> ThreadPoolExecutor:
+        with self.__lock:
+            if self.__pool is None:
+                self.__pool = ThreadPoolExecutor(max_workers=self.__workers, thread_name_prefix='timeout')
+            return self.__pool
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> ftrs.Future:
+        self.__calls += 1
+        return self.__get_pool().submit(func, *args, **kwargs)
+
+    def __finished(self, future: ftrs.Future):
+        with self.__lock:
+            self.__abandoned -= 1
+
+    def abandon(self, future: ftrs.Future) -> None:
+        self.__timeouts += 1
+        if future.cancel():
+            self.__cancelled += 1
+            return
+        with self.__lock:
+            self.__abandoned += 1
+            self.__abandoned_total += 1
+        # Called at once if the call has finished in the meantime
+        future.add_done_callback(self.__finished)
+
+    def close(self):
+        with self.__lock:
+            if self.__pool is not None:
+                self.__pool.shutdown(wait=False)
+                self.__pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'thread_workers': self.__workers,
+            'thread_calls': self.__calls,
+            'thread_timeouts': self.__timeouts,
+            'thread_cancelled': self.__cancelled,
+            'thread_abandoned': self.__abandoned,
+            'thread_abandoned_total': self.__abandoned_total,
+        }
+
+
+def _wait_thread(
+        func: Callable[..., Any],
+        args: tuple,
+        kwargs: Dict[str, Any],
+        timeout: Optional[float],
+        exception_type: type) -> Any:
+    future = _thread_pool.submit(func, *args, **kwargs)
+    scope = event_loop.current_scope()
+    try:
+        return future.result(timeout=timeout) if scope is None else scope.wait(future, timeout)
+    except (ftrs.TimeoutError, ftrs.CancelledError) as exc:
+        _thread_pool.abandon(future)
+        _raise_exception(exception_type, timeout, func, exc)
+
+
+def _worker_main(conn: Connection, task: Optional[tuple] = None):
+    # Interrupting the console must not take the workers down with a traceback each
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        if task is None:
             try:
-                self.__queue.put(self.__func(*args, **kwargs))
-            except Exception as e:
-                self.__handler(e)
-
-        __process = Process(target=__target, daemon=True)
-        start_time = time.perf_counter()
-        __process.start()
-        while time.perf_counter() - start_time <= self.__time:
+                task = conn.recv()
+            except EOFError:
+                return
+            except Exception as exc:
+                # e.g. the callable was defined in `__main__` after the worker was forked
+                conn.send((False, exc))
+                continue
+        func, args, kwargs = task
+        task = None
+        try:
+            reply = True, func(*args, **kwargs)
+        except Exception as exc:
+            reply = False, exc
+        try:
+            conn.send(reply)
+        except Exception as exc:
+            # The result or the exception could not be pickled
+            conn.send((False, RuntimeError(f"{exc!r} when sending the result of {func!r}")))
+
+
+class _Worker:
+    def __init__(self, context, task: Optional[tuple] = None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, task), name='timeout_worker', daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class _ProcessPool:
+    '''Pre-forked worker processes for `WrapType.PROCESS`.
+
+    A call is sent to an idle worker and its result is waited for on the pipe together with the process sentinel, so nothing polls.
+    A worker that runs past the deadline is killed and replaced right away, which keeps the pool warm for the next call.
+    Callables that cannot be pickled, such as closures, run in a process forked for the call instead.
+    '''
+
+    def __init__(self, size: int):
+        self.__size = max(size, 1)
+        self.__context = multiprocessing.get_context('fork')
+        self.__idle: List[_Worker] = list()
+        self.__started = 0
+        self.__condition = threading.Condition()
+
+        self.__calls = 0
+        self.__forked_calls = 0
+        self.__timeouts = 0
+        self.__crashes = 0
+        self.__replaced = 0
+
+    def __acquire(self, deadline: Optional[float]) -> Optional[_Worker]:
+        with self.__condition:
+            if self.__started == 0:
+                self.__idle.extend(_Worker(self.__context) for _ in range(self.__size))
+                self.__started = self.__size
+            while not self.__idle:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.__condition.wait(remaining)
+            return self.__idle.pop()
+
+    def __release(self, worker: _Worker):
+        with self.__condition:
+            self.__idle.append(worker)
+            self.__condition.notify()
+
+    def __replace(self, worker: _Worker):
+        worker.kill()
+        self.__replaced += 1
+        self.__release(_Worker(self.__context))
+
+    def __call__(
+            self,
+            func: Callable[..., Any],
+            args: tuple,
+            kwargs: Dict[str, Any],
+            timeout: Optional[float]) -> Tuple[bool, Any]:
+        '''Run `func` in a worker. Returns `(True, result)`, or `(False, exception)` when it raised, died or timed out, with None for the exception on timeout.'''
+        self.__calls += 1
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        task = (func, args, kwargs)
+        try:
+            payload = pickle.dumps(task)
+        except Exception:
+            self.__forked_calls += 1
+            worker = _Worker(self.__context, task)
+            pooled = False
+        else:
+            if (worker := self.__acquire(deadline)) is None:
+                self.__timeouts += 1
+                return False, None
+            worker.conn.send_bytes(payload)
+            pooled = True
+
+        remaining = None if deadline is None else max(deadline - time.perf_counter(), 0)
+        ready = wait([worker.conn, worker.process.sentinel], remaining)
+        if worker.conn in ready:
             try:
-                ret = True, self.__queue.get_nowait()
-            except Empty:
-                ret = False, None
+                flag, ret = worker.conn.recv()
+            except EOFError:
+                ready = [worker.process.sentinel]
             else:
-                break
-        __process.kill()
-        return ret
+                if pooled:
+                    self.__release(worker)
+                else:
+                    worker.kill()
+                return flag, ret
+
+        if ready:
+            self.__crashes += 1
+            ret = RuntimeError(f"Worker process exited with code {worker.process.exitcode} when running {func!r}")
+        else:
+            self.__timeouts += 1
+            ret = None
+        if pooled:
+            self.__replace(worker)
+        else:
+            worker.kill()
+        return False, ret
+
+    def close(self):
+        with self.__condition:
+            for worker in self.__idle:
+                worker.kill()
+            self.__idle.clear()
+            self.__started = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'process_workers': self.__started,
+            'process_idle': len(self.__idle),
+            'process_calls': self.__calls,
+            'process_forked_calls': self.__forked_calls,
+            'process_timeouts': self.__timeouts,
+            'process_crashes': self.__crashes,
+            'process_replaced': self.__replaced,
+        }
+
+
+_thread_pool = _ThreadPool(TimeoutConfig.timeout_thread_workers)
+_process_pool = _ProcessPool(TimeoutConfig.timeout_process_workers)
+atexit.register(_thread_pool.close)
+atexit.register(_process_pool.close)
+register_stats('timeout', lambda: {**_thread_pool.stats(), **_process_pool.stats()})
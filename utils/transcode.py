@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import threading
+import time
+
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from .config import BaseConfig
+from .metrics import stage_seconds
+from .stats import register_stats
+
+
+__all__ = (
+    'TranscodeConfig',
+    'PHOTO_MAX_BYTES',
+    'PHOTO_MAX_SIDE_SUM',
+    'transcode',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+
+# Limits of `sendPhoto`, anything larger is rejected or sent as a document by Telegram
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+PHOTO_MAX_SIDE_SUM = 10000
+
+
+class TranscodeConfig(BaseConfig, config_file="push_config.json"):
+    transcode_workers: Optional[int] = 2
+    transcode_jpeg_quality: Optional[int] = 90
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def _encode(image: Image.Image, format: str, quality: int) -> bytes:
+    output = BytesIO()
+    if format == "PNG":
+        image.save(output, "PNG", compress_level=6)
+    else:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(output, "JPEG", quality=quality, optimize=False)
+    return output.getvalue()
+
+
+def _target_size(data: bytes, max_side: Optional[int]) -> Optional[Tuple[int, int]]:
+    '''The size to scale to, or `None` if the image can be sent as it is. Only reads the header.'''
+    image = Image.open(BytesIO(data))
+    if image.format not in ("JPEG", "PNG"):
+        return None
+    width, height = image.size
+    scale = 1.0
+    if max_side:
+        scale = min(scale, max_side / max(width, height))
+    scale = min(scale, PHOTO_MAX_SIDE_SUM / (width + height))
+    if scale >= 1 and len(data) <= PHOTO_MAX_BYTES:
+        return None
+    return max(1, int(width * min(scale, 1))), max(1, int(height * min(scale, 1)))
+
+
+def _transcode(data: bytes, size: Tuple[int, int], quality: int) -> Tuple[bytes, str, float]:
+    '''Runs in a worker process. Returns the output, its format and the seconds spent.'''
+    start = time.perf_counter()
+    image = Image.open(BytesIO(data))
+    if image.format == "JPEG":
+        # Let the decoder skip the DCT coefficients we are about to throw away
+        image.draft("RGB", size)
+    image.thumbnail(size, Image.LANCZOS)
+
+    format = "PNG" if _has_alpha(image) else "JPEG"
+    output = _encode(image, format, quality)
+    if len(output) > PHOTO_MAX_BYTES and format == "PNG":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+        image, format = background, "JPEG"
+        output = _encode(image, format, quality)
+    while len(output) > PHOTO_MAX_BYTES and quality > 50:
+        quality -= 10
+        output = _encode(image, format, quality)
+    return output, format, time.perf_counter() - start
+
+
+class _Transcoder:
+    '''A bounded process pool for image transcoding, created on first use.'''
+
+    def __init__(self, workers: int, quality: int):
+        self.__workers = workers
+        self.__quality = quality
+        self.__pool: Optional[ProcessPoolExecutor] = None
+        self.__lock = threading.Lock()
+
+        self.__images = 0
+        self.__passthrough = 0
+        self.__failed = 0
+        self.__seconds_total = 0.0
+        self.__seconds_max = 0.0
+        self.__bytes_in = 0
+        self.__bytes_out = 0
+
+    def __get_pool(self) -> ProcessPoolExecutor:
+        with self.__lock:
+            if self.__pool is None:
+                self.__pool = ProcessPoolExecutor(max_workers=self.__workers)
+            return self.__pool
+
+    async def __call__(self, data: bytes, max_side: Optional[int] = None, name: str = "", backend: str = "") -> bytes:
+        '''Fit an image within `max_side` and Telegram's photo limits, off the event loop.
+
+        JPEG and PNG images that already fit are returned untouched, other formats are never converted. On failure the original data is returned.
+        '''
+        try:
+            if (size := _target_size(data, max_side)) is None:
+                self.__passthrough += 1
+                return data
+            with stage_seconds.time(stage="transcode", backend=backend):
+                output, format, seconds = await asyncio.get_running_loop().run_in_executor(
+                    self.__get_pool(), _transcode, data, size, self.__quality)
+        except Exception:
+            self.__failed += 1
+            logger.exception(f"转码失败: {name}")
+            return data
+
+        self.__images += 1
+        self.__seconds_total += seconds
+        self.__seconds_max = max(self.__seconds_max, seconds)
+        self.__bytes_in += len(data)
+        self.__bytes_out += len(output)
+        logger.info(f"转码: {name} {format} {len(data)} -> {len(output)} 字节, 用时 {seconds:.3f} 秒")
+        return output
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'images': self.__images,
+            'passthrough': self.__passthrough,
+            'failed': self.__failed,
+            'seconds_avg': self.__seconds_total / self.__images if self.__images else 0.0,
+            'seconds_max': self.__seconds_max,
+            'bytes_in': self.__bytes_in,
+            'bytes_out': self.__bytes_out,
+        }
+
+
+transcode = _Transcoder(TranscodeConfig.transcode_workers, TranscodeConfig.transcode_jpeg_quality)
+register_stats('transcode', transcode.stats)
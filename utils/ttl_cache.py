@@ -0,0 +1,84 @@
+import threading
+import time
+
+from typing import Any, Dict, Hashable, Tuple
+from collections import OrderedDict
+
+
+__all__ = (
+    'MISS',
+    'TTLCache',
+)
+
+
+MISS = object()
+
+
+class TTLCache:
+    '''LRU cache whose entries expire after their own TTL, bounded by the total weight of the stored values.'''
+
+    def __init__(self, max_weight: int):
+        self.__max_weight = max_weight
+        self.__weight = 0
+        self.__entries: 'OrderedDict[Hashable, Tuple[float, int, Any]]' = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__negative_hits = 0
+        self.__misses = 0
+        self.__expired = 0
+        self.__evicted = 0
+
+    def get(self, key: Hashable) -> Any:
+        '''Return the cached value, or `MISS` if there is none or it has expired.'''
+        with self.__lock:
+            try:
+                expires_at, weight, value = self.__entries[key]
+            except KeyError:
+                self.__misses += 1
+                return MISS
+            if expires_at <= time.monotonic():
+                self.__pop(key)
+                self.__expired += 1
+                self.__misses += 1
+                return MISS
+            self.__entries.move_to_end(key)
+            if value is None:
+                self.__negative_hits += 1
+            else:
+                self.__hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, ttl: float, weight: int = 1) -> None:
+        if ttl <= 0 or weight > self.__max_weight:
+            return
+        with self.__lock:
+            if key in self.__entries:
+                self.__pop(key)
+            self.__entries[key] = (time.monotonic() + ttl, weight, value)
+            self.__weight += weight
+            while self.__weight > self.__max_weight:
+                self.__pop(next(iter(self.__entries)))
+                self.__evicted += 1
+
+    def __pop(self, key: Hashable):
+        _, weight, _ = self.__entries.pop(key)
+        self.__weight -= weight
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__weight = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.__lock:
+            lookups = self.__hits + self.__negative_hits + self.__misses
+            return {
+                'entries': len(self.__entries),
+                'weight': self.__weight,
+                'hits': self.__hits,
+                'negative_hits': self.__negative_hits,
+                'misses': self.__misses,
+                'hit_ratio': (self.__hits + self.__negative_hits) / lookups if lookups else 0.0,
+                'expired': self.__expired,
+                'evicted': self.__evicted,
+            }
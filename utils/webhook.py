@@ -0,0 +1,190 @@
+import hmac
+import json
+import logging
+import threading
+
+from typing import Any, Iterable, List, Optional, Set, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telegram import Update
+from telegram.ext import (
+    Updater,
+    Dispatcher,
+    Handler,
+    CallbackQueryHandler,
+    ChatJoinRequestHandler,
+    ChatMemberHandler,
+    ChosenInlineResultHandler,
+    CommandHandler,
+    ConversationHandler,
+    InlineQueryHandler,
+    MessageHandler,
+    PollAnswerHandler,
+    PollHandler,
+    PreCheckoutQueryHandler,
+    ShippingQueryHandler,
+)
+
+from .config import BaseConfig
+
+
+__all__ = (
+    'WebhookConfig',
+    'WebhookServer',
+    'allowed_updates',
+    'start_updates',
+)
+
+
+logger = logging.getLogger('push_helper')
+
+
+class WebhookConfig(BaseConfig, config_file="push_config.json"):
+    webhook_url: Optional[str] = str()              # public url Telegram posts to, empty for long polling
+    webhook_listen: Optional[str] = "127.0.0.1"
+    webhook_port: Optional[int] = 8443
+    webhook_path: Optional[str] = "/telegram"
+    webhook_secret_token: Optional[str] = str()
+    webhook_max_connections: Optional[int] = 40
+
+    @ classmethod
+    def _check(cls, _attr_name: str, _attr_value: Any) -> Tuple[str, Any]:
+        return _attr_name, _attr_value
+
+
+_MESSAGES = (
+    Update.MESSAGE, Update.EDITED_MESSAGE, Update.CHANNEL_POST, Update.EDITED_CHANNEL_POST,
+)
+_UPDATE_TYPES = (
+    (CallbackQueryHandler, (Update.CALLBACK_QUERY,)),
+    (InlineQueryHandler, (Update.INLINE_QUERY,)),
+    (ChosenInlineResultHandler, (Update.CHOSEN_INLINE_RESULT,)),
+    (ShippingQueryHandler, (Update.SHIPPING_QUERY,)),
+    (PreCheckoutQueryHandler, (Update.PRE_CHECKOUT_QUERY,)),
+    (PollHandler, (Update.POLL,)),
+    (PollAnswerHandler, (Update.POLL_ANSWER,)),
+    (ChatJoinRequestHandler, (Update.CHAT_JOIN_REQUEST,)),
+    # Both match on `update.effective_message`, which includes channel posts and edits
+    (CommandHandler, _MESSAGES),
+    (MessageHandler, _MESSAGES),
+)
+
+
+def _update_types(handler: Handler) -> Optional[Iterable[str]]:
+    if isinstance(handler, ConversationHandler):
+        types = set()
+        for child in handler.entry_points + handler.fallbacks + [h for hs in handler.states.values() for h in hs]:
+            if (child_types := _update_types(child)) is None:
+                return None
+            types.update(child_types)
+        return types
+    if isinstance(handler, ChatMemberHandler):
+        return {
+            ChatMemberHandler.MY_CHAT_MEMBER: (Update.MY_CHAT_MEMBER,),
+            ChatMemberHandler.CHAT_MEMBER: (Update.CHAT_MEMBER,),
+        }.get(handler.chat_member_types, (Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER))
+    for handler_type, types in _UPDATE_TYPES:
+        if isinstance(handler, handler_type):
+            return types
+    return None
+
+
+def allowed_updates(dispatcher: Dispatcher) -> List[str]:
+    '''The update types the registered handlers can handle, or all types if some handler cannot be classified.'''
+    types: Set[str] = set()
+    for handlers in dispatcher.handlers.values():
+        for handler in handlers:
+            if (handler_types := _update_types(handler)) is None:
+                return list(Update.ALL_TYPES)
+            types.update(handler_types)
+    return [update_type for update_type in Update.ALL_TYPES if update_type in types]
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    server: 'WebhookServer'
+    max_body = 1024 * 1024
+
+    def do_POST(self):
+        if self.path.split('?', 1)[0] != self.server.url_path:
+            return self.__respond(404)
+        secret = self.server.secret_token
+        if secret and not hmac.compare_digest(
+                self.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret):
+            return self.__respond(403)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            return self.__respond(400)
+        if not 0 < length <= self.max_body:
+            return self.__respond(413 if length else 400)
+        try:
+            data = json.loads(self.rfile.read(length))
+        except ValueError:
+            return self.__respond(400)
+        self.server.updater.update_queue.put(Update.de_json(data, self.server.updater.bot))
+        self.__respond(200)
+
+    def do_GET(self):
+        self.__respond(405)
+
+    def __respond(self, code: int):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format: str, *args: Any):
+        logger.debug(f"webhook: {format % args}")
+
+
+class WebhookServer(ThreadingHTTPServer):
+    '''Receives updates posted by Telegram and puts them on the update queue of `updater`.
+
+    It is meant to listen on a local address behind a reverse proxy that terminates TLS.
+    '''
+    daemon_threads = True
+
+    def __init__(self, updater: Updater, listen: str, port: int, path: str, secret_token: str):
+        self.updater = updater
+        self.url_path = path if path.startswith('/') else f'/{path}'
+        self.secret_token = secret_token
+        super().__init__((listen, port), _WebhookHandler)
+
+    def shutdown(self):
+        super().shutdown()
+        self.server_close()
+
+
+def start_webhook(updater: Updater, url: str, listen: str, port: int, path: str, secret_token: str, max_connections: int) -> WebhookServer:
+    server = WebhookServer(updater, listen, port, path, secret_token)
+    types = allowed_updates(updater.dispatcher)
+    updater.bot.set_webhook(
+        url=url,
+        allowed_updates=types,
+        secret_token=secret_token or None,
+        max_connections=max_connections,
+    )
+    dispatcher_ready = threading.Event()
+    updater.running = True
+    # Updater.stop() shuts the server down through `httpd`, like its own webhook server
+    updater.httpd = server
+    updater._init_thread(updater.dispatcher.start, "dispatcher", ready=dispatcher_ready)
+    updater._init_thread(server.serve_forever, "webhook")
+    dispatcher_ready.wait()
+    logger.info(f"Webhook 已启动: 监听 {listen}:{port}{server.url_path}, 接收 {', '.join(types)}")
+    return server
+
+
+def start_updates(updater: Updater) -> str:
+    '''Receive updates through the webhook if `webhook_url` is set, through long polling otherwise. Returns the mode used.'''
+    if WebhookConfig.webhook_url:
+        start_webhook(
+            updater,
+            WebhookConfig.webhook_url,
+            WebhookConfig.webhook_listen,
+            WebhookConfig.webhook_port,
+            WebhookConfig.webhook_path,
+            WebhookConfig.webhook_secret_token,
+            WebhookConfig.webhook_max_connections,
+        )
+        return 'webhook'
+    updater.start_polling(allowed_updates=allowed_updates(updater.dispatcher))
+    return 'polling'